@@ -0,0 +1,123 @@
+import json
+import os
+import numpy as np
+from nbody import G, STATE_COLUMNS, StateHistory
+
+# Ephemeris files start with this, followed by the JSON header
+EPHEMERIS_MAGIC = b"EPHEMERIS\x01"
+# The header is padded to this size and the state array starts right after it, so the header
+# can be rewritten in place and the array stays aligned
+HEADER_SIZE = 4096
+
+
+class Ephemeris:
+    """
+    State history of a propagation stored on disk: a JSON header with the bodies, the constants,
+    dt and anything else the propagation depended on, followed by the raw (samples, bodies, 4)
+    array of a StateHistory.
+
+    The array is memory-mapped, so opening an ephemeris is instant and only the parts that are
+    used are read from disk. Use history.window() to read a time range. Read-only ephemerides
+    can be opened by any number of processes at once.
+    """
+
+    def __init__(self, path: str, header: dict, mode: str = "r") -> None:
+        self.path = path
+        self.header = header
+        data = np.memmap(path, dtype=np.dtype(header["dtype"]), mode=mode, offset=HEADER_SIZE,
+                         shape=(header["samples"], len(header["bodies"]), len(STATE_COLUMNS)))
+        self.history = StateHistory(*data.shape[:2], header["dt"], data=data)
+
+    @property
+    def names(self) -> 'list[str]':
+        return self.header["bodies"]
+
+    @property
+    def masses(self) -> np.ndarray:
+        return np.array(self.header["masses"])
+
+    @property
+    def complete(self) -> bool:
+        return self.header["complete"]
+
+    def matches(self, header: dict) -> bool:
+        """
+        Whether the ephemeris is complete and was made with the same header, apart from completeness
+        """
+        return self.complete and all(self.header.get(key) == value for key, value in header.items() if key != "complete")
+
+    def finish(self) -> None:
+        """
+        Flushes the array and marks the ephemeris as complete, once the propagation has filled it
+        """
+        self.history.data.flush()
+        self.header["complete"] = True
+        with open(self.path, "r+b") as file:
+            write_header(file, self.header)
+
+
+def write_header(file, header: dict) -> None:
+    encoded = json.dumps(header).encode()
+    if len(EPHEMERIS_MAGIC) + len(encoded) + 1 > HEADER_SIZE:
+        raise ValueError(f"Ephemeris header is longer than {HEADER_SIZE} bytes")
+    file.write((EPHEMERIS_MAGIC + encoded).ljust(HEADER_SIZE - 1) + b"\n")
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as file:
+        block = file.read(HEADER_SIZE)
+    if not block.startswith(EPHEMERIS_MAGIC):
+        raise ValueError(f"{path} is not an ephemeris file")
+    return json.loads(block[len(EPHEMERIS_MAGIC):])
+
+
+def make_header(samples: int, dt: float, names: 'list[str]', masses: 'list[float]',
+                dtype=np.float64, **metadata) -> dict:
+    # Round trip through JSON so the header compares equal to one read back from a file
+    return json.loads(json.dumps({
+        "G": G,
+        "dt": dt,
+        "samples": samples,
+        "bodies": list(names),
+        "masses": [float(mass) for mass in masses],
+        "columns": list(STATE_COLUMNS),
+        "dtype": np.dtype(dtype).str,
+        "complete": False,
+        **metadata,
+    }))
+
+
+def create_ephemeris(path: str, samples: int, dt: float, names: 'list[str]', masses: 'list[float]',
+                     dtype=np.float64, **metadata) -> Ephemeris:
+    """
+    Creates an ephemeris file with room for samples samples of every body, to be filled by
+    nbody.propagate(..., out=ephemeris.history) and then marked done with finish().
+    Any metadata, for example the integrator and the initial state, is stored in the header as
+    well and must be JSON serializable.
+    """
+    header = make_header(samples, dt, names, masses, dtype, **metadata)
+    with open(path, "wb") as file:
+        write_header(file, header)
+    return Ephemeris(path, header, mode="r+")
+
+
+def open_ephemeris(path: str) -> Ephemeris:
+    """
+    Opens an ephemeris file read-only
+    """
+    return Ephemeris(path, read_header(path))
+
+
+def find_ephemeris(path: str, samples: int, dt: float, names: 'list[str]', masses: 'list[float]',
+                   dtype=np.float64, **metadata) -> "Ephemeris | None":
+    """
+    Opens the ephemeris at path if there is a complete one that create_ephemeris() would have
+    made with the same arguments, otherwise returns None
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        ephemeris = open_ephemeris(path)
+    except ValueError:
+        return None
+    return ephemeris if ephemeris.matches(make_header(samples, dt, names, masses, dtype, **metadata)) else None
@@ -0,0 +1,178 @@
+import math
+import numpy as np
+from link_analysis import C
+from nbody import CHUNK_SAMPLES, G, STATE_COLUMNS, StateHistory
+
+# Newton's method on Kepler's equation stops once every step is below this (rad)
+KEPLER_TOLERANCE = 1e-13
+KEPLER_MAX_ITERATIONS = 50
+# Orbits closer to circular than this have no meaningful periapsis
+CIRCULAR_ECCENTRICITY = 1e-12
+
+
+def get_elements(positions: np.ndarray, velocities: np.ndarray,
+                 mu: np.ndarray) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]':
+    """
+    Orbital elements of bound orbits in the plane, from (bodies, 2) positions and velocities
+    relative to the body they orbit and mu = G(M + m) of every pair.
+    https://en.wikipedia.org/wiki/Orbital_elements
+
+    Returns the semi-major axis (m), the eccentricity, the angle of the periapsis from the x axis,
+    the mean anomaly at the given state, and the direction (1 counterclockwise, -1 clockwise).
+    """
+    distances = np.hypot(positions[:, 0], positions[:, 1])
+    speeds_squared = np.einsum("ij,ij->i", velocities, velocities)
+    # r * v, positive while moving away from the periapsis
+    radial = np.einsum("ij,ij->i", positions, velocities)
+    angular_momenta = positions[:, 0] * velocities[:, 1] - positions[:, 1] * velocities[:, 0]
+
+    energies = speeds_squared / 2 - mu / distances
+    if np.any(energies >= 0):
+        raise ValueError("Kepler orbits need every body to be bound to the central one")
+    semi_major_axes = -mu / (2 * energies)
+
+    # https://en.wikipedia.org/wiki/Eccentricity_vector
+    eccentricity_vectors = ((speeds_squared - mu / distances)[:, None] * positions - radial[:, None] * velocities) / mu[:, None]
+    eccentricities = np.hypot(eccentricity_vectors[:, 0], eccentricity_vectors[:, 1])
+    periapsis_angles = np.arctan2(eccentricity_vectors[:, 1], eccentricity_vectors[:, 0])
+
+    # e cos(E) = 1 - r/a and e sin(E) = r * v / sqrt(mu a)
+    # https://en.wikipedia.org/wiki/Eccentric_anomaly
+    eccentric_anomalies = np.arctan2(radial / np.sqrt(mu * semi_major_axes), 1 - distances / semi_major_axes)
+
+    # Measure circular orbits from the current position instead
+    circular = eccentricities < CIRCULAR_ECCENTRICITY
+    periapsis_angles = np.where(circular, np.arctan2(positions[:, 1], positions[:, 0]), periapsis_angles)
+    eccentric_anomalies = np.where(circular, 0, eccentric_anomalies)
+
+    mean_anomalies = eccentric_anomalies - eccentricities * np.sin(eccentric_anomalies)
+    directions = np.where(angular_momenta < 0, -1.0, 1.0)
+
+    return (semi_major_axes, eccentricities, periapsis_angles, mean_anomalies, directions)
+
+
+def solve_kepler(mean_anomalies: np.ndarray, eccentricities: np.ndarray) -> np.ndarray:
+    """
+    Eccentric anomalies E with E - e sin(E) = M, for any number of mean anomalies M at once,
+    using Newton's method
+    https://en.wikipedia.org/wiki/Kepler%27s_equation#Numerical_approximation_of_inverse_problem
+    """
+    mean_anomalies = np.remainder(mean_anomalies + math.pi, 2 * math.pi) - math.pi
+    # Starting from pi converges for any eccentricity, M is closer for the usual ones
+    eccentric_anomalies = np.where(eccentricities < 0.8, mean_anomalies, math.pi * np.sign(mean_anomalies))
+    for _ in range(KEPLER_MAX_ITERATIONS):
+        steps = ((eccentric_anomalies - eccentricities * np.sin(eccentric_anomalies) - mean_anomalies)
+                 / (1 - eccentricities * np.cos(eccentric_anomalies)))
+        eccentric_anomalies -= steps
+        if np.all(np.abs(steps) < KEPLER_TOLERANCE):
+            break
+    return eccentric_anomalies
+
+
+class KeplerOrbits:
+    """
+    Analytic two-body orbits of every body around a central one (the heaviest by default), from
+    their state at epoch seconds. The state at any time is found by solving Kepler's equation,
+    in O(1) per time and body, without integrating up to it.
+
+    Only the pull of the central body is included, the bodies don't pull on each other, and the
+    central body keeps moving with its initial velocity. Good for planets around the Sun, and
+    for checking nbody.propagate() against.
+    """
+
+    def __init__(self, positions: np.ndarray, velocities: np.ndarray, masses: np.ndarray,
+                 central: "int | None" = None, epoch: float = 0.0) -> None:
+        positions = np.asarray(positions, dtype=np.float64)
+        velocities = np.asarray(velocities, dtype=np.float64)
+        masses = np.asarray(masses, dtype=np.float64)
+
+        self.central = int(np.argmax(masses)) if central is None else central
+        self.epoch = epoch
+        self.body_count = len(masses)
+        self.central_position = positions[self.central]
+        self.central_velocity = velocities[self.central]
+
+        # Indices of the orbiting bodies, which the elements are stored for
+        self.bodies = np.flatnonzero(np.arange(self.body_count) != self.central)
+        mu = G * (masses[self.central] + masses[self.bodies])
+        (self.semi_major_axes, self.eccentricities, self.periapsis_angles,
+         self.mean_anomalies, self.directions) = get_elements(
+            positions[self.bodies] - self.central_position, velocities[self.bodies] - self.central_velocity, mu)
+        self.mean_motions = np.sqrt(mu / self.semi_major_axes**3)
+
+    @property
+    def periods(self) -> np.ndarray:
+        """
+        Orbital period of every orbiting body in seconds
+        """
+        return 2 * math.pi / self.mean_motions
+
+    def get_states(self, times: np.ndarray) -> np.ndarray:
+        """
+        State of every body at times seconds, of shape times.shape + (bodies, 4) with the columns
+        in STATE_COLUMNS order
+        """
+        elapsed = np.asarray(times, dtype=np.float64)[..., None] - self.epoch
+        e = self.eccentricities
+        eccentric_anomalies = solve_kepler(self.mean_anomalies + self.mean_motions * elapsed, e)
+        cos_e = np.cos(eccentric_anomalies)
+        sin_e = np.sin(eccentric_anomalies)
+
+        # Position and velocity along the major and minor axes
+        a = self.semi_major_axes
+        b = a * np.sqrt(1 - e**2) * self.directions
+        rates = self.mean_motions / (1 - e * cos_e)
+        major = (a * (cos_e - e), -a * sin_e * rates)
+        minor = (b * sin_e, b * cos_e * rates)
+
+        # Rotated onto the x and y axes, around the central body
+        cos_w = np.cos(self.periapsis_angles)
+        sin_w = np.sin(self.periapsis_angles)
+        central_positions = self.central_position + self.central_velocity * elapsed[..., None]
+
+        states = np.empty(elapsed.shape[:-1] + (self.body_count, len(STATE_COLUMNS)))
+        states[..., self.central, 0:2] = central_positions[..., 0, :]
+        states[..., self.central, 2:4] = self.central_velocity
+        states[..., self.bodies, 0] = central_positions[..., 0] + cos_w * major[0] - sin_w * minor[0]
+        states[..., self.bodies, 1] = central_positions[..., 1] + sin_w * major[0] + cos_w * minor[0]
+        states[..., self.bodies, 2] = self.central_velocity[0] + cos_w * major[1] - sin_w * minor[1]
+        states[..., self.bodies, 3] = self.central_velocity[1] + sin_w * major[1] + cos_w * minor[1]
+        return states
+
+    def get_positions(self, times: np.ndarray) -> np.ndarray:
+        return self.get_states(times)[..., 0:2]
+
+    def get_distances(self, origin: int, destination: int, times: np.ndarray) -> np.ndarray:
+        """
+        Distance (m) between two bodies at times seconds
+        """
+        positions = self.get_positions(times)
+        return np.hypot(*np.moveaxis(positions[..., destination, :] - positions[..., origin, :], -1, 0))
+
+    def get_delays(self, origin: int, destination: int, times: np.ndarray) -> np.ndarray:
+        """
+        One-way light delay (s) between two bodies at times seconds
+        """
+        return self.get_distances(origin, destination, times) / C
+
+    def fill_history(self, history: StateHistory) -> StateHistory:
+        """
+        Writes the state at every sample time of history into it, CHUNK_SAMPLES at a time,
+        and returns it. The same as nbody.propagate(..., out=history) without the integration.
+        """
+        for first in range(0, len(history), CHUNK_SAMPLES):
+            times = history.times[first:first + CHUNK_SAMPLES]
+            history.data[first:first + len(times)] = self.get_states(times)
+        return history
+
+    def get_deviations(self, history: StateHistory) -> np.ndarray:
+        """
+        Largest distance (m) of every body in history from its Kepler orbit, for example to see
+        how much the bodies pull each other off their two-body orbits in a propagation
+        """
+        deviations = np.zeros(self.body_count)
+        for first in range(0, len(history), CHUNK_SAMPLES):
+            chunk = history.data[first:first + CHUNK_SAMPLES, :, 0:2].astype(np.float64)
+            expected = self.get_positions(history.times[first:first + len(chunk)])
+            deviations = np.maximum(deviations, np.hypot(*np.moveaxis(chunk - expected, -1, 0)).max(axis=0))
+        return deviations
@@ -0,0 +1,163 @@
+import numpy as np
+from nbody import StateHistory
+
+C = 299_792_458 # Speed of Light (m/s)
+
+
+def analyze_link(history: StateHistory, origin: int, destination: int, occulter: int,
+                 blackout_radius: float) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]':
+    """
+    Analyzes the radio link between two bodies of a history at every sample at once.
+    origin, destination and occulter are body indices, the link is blacked out when the
+    straight line between origin and destination passes within blackout_radius of the occulter
+    (a solar conjunction when the occulter is the Sun).
+
+    Returns the distance (m), the one-way light delay (s), the blackout mask, and the point of
+    the link closest to the occulter, of shape (samples, 2).
+    """
+    origins = history.positions[:, origin].astype(np.float64)
+    occulters = history.positions[:, occulter].astype(np.float64)
+    links = history.positions[:, destination] - origins
+    to_occulter = occulters - origins
+
+    distances = np.hypot(links[:, 0], links[:, 1])
+    delays = distances / C
+
+    # Project the occulter onto the link, k is how far along the link the projection is
+    # https://stackoverflow.com/a/1079478
+    # u * v / |v|**2
+    k = np.einsum("ij,ij->i", to_occulter, links) / distances**2
+
+    # Only a projection between the two ends can be blocked
+    between = (k >= 0) & (k < 1)
+    # P_u(v) = v(u * v) / |v|**2, clamped to the ends of the link
+    closest_points = origins + links * np.clip(k, 0, 1)[:, None]
+    miss_distances = np.hypot(*(closest_points - occulters).T)
+    blackout = between & (miss_distances < blackout_radius)
+
+    return (distances, delays, blackout, closest_points)
+
+
+class SegmentTree:
+    """
+    Answers range queries of reduce (np.minimum or np.maximum) over a fixed array in O(log n),
+    using 2n memory. identity is the result over an empty range.
+    https://codeforces.com/blog/entry/18051
+    """
+
+    def __init__(self, values: np.ndarray, reduce=np.maximum, identity: float = -np.inf) -> None:
+        self.reduce = reduce
+        self.identity = identity
+        self.size = 1 << max(0, len(values) - 1).bit_length()
+        self.tree = np.full(2 * self.size, identity, dtype=np.float64)
+        self.tree[self.size:self.size + len(values)] = values
+        # Fill one level at a time, every node is the reduction of its two children
+        level = self.size // 2
+        while level:
+            self.tree[level:2 * level] = reduce(self.tree[2 * level:4 * level:2], self.tree[2 * level + 1:4 * level:2])
+            level //= 2
+
+    def query(self, first: int, last: int) -> float:
+        """
+        Reduction of values[first:last]
+        """
+        result = self.identity
+        first += self.size
+        last += self.size
+        while first < last:
+            if first & 1:
+                result = self.reduce(result, self.tree[first])
+                first += 1
+            if last & 1:
+                last -= 1
+                result = self.reduce(result, self.tree[last])
+            first >>= 1
+            last >>= 1
+        return float(result)
+
+
+class LinkIndex:
+    """
+    Index of a link's delay and blackouts over time, as returned by analyze_link(), for
+    answering planning questions without going through every sample.
+
+    Blackouts are kept as sorted [start, end) intervals of sample times, where end is the first
+    sample with the link back up. The delays are kept in min and max segment trees. Every query
+    takes O(log n) time in the number of samples or blackouts.
+    """
+
+    def __init__(self, times: np.ndarray, delays: np.ndarray, blackout: np.ndarray) -> None:
+        self.times = np.asarray(times, dtype=np.float64)
+        self.min_delays = SegmentTree(delays, np.minimum, np.inf)
+        self.max_delays = SegmentTree(delays, np.maximum, -np.inf)
+
+        # +1 where a blackout starts and -1 on the first sample after it
+        edges = np.diff(np.asarray(blackout, dtype=np.int8), prepend=0, append=0)
+        self.blackout_starts = self.times[np.flatnonzero(edges == 1)]
+        # A blackout still going on at the end of the history ends with it
+        self.blackout_ends = self.times[np.minimum(np.flatnonzero(edges == -1), len(self.times) - 1)]
+        # Total blackout time before each interval, for get_blackout_time()
+        self.blackout_time_before = np.concatenate(([0], np.cumsum(self.blackout_ends - self.blackout_starts)))
+
+    def get_samples(self, start: float, end: float) -> 'tuple[int, int]':
+        """
+        Slice bounds of the samples from start to end seconds, inclusive
+        """
+        return (int(np.searchsorted(self.times, start, "left")), int(np.searchsorted(self.times, end, "right")))
+
+    def get_min_delay(self, start: float, end: float) -> float:
+        """
+        Shortest one-way delay (s) from start to end seconds, including any blackouts
+        """
+        return self.min_delays.query(*self.get_samples(start, end))
+
+    def get_max_delay(self, start: float, end: float) -> float:
+        """
+        Longest one-way delay (s) from start to end seconds, including any blackouts
+        """
+        return self.max_delays.query(*self.get_samples(start, end))
+
+    def get_next_blackout(self, time: float) -> "tuple[float, float] | None":
+        """
+        The (start, end) of the blackout going on at time or the first one after it,
+        or None if there are no more
+        """
+        i = np.searchsorted(self.blackout_ends, time, "right")
+        if i == len(self.blackout_ends):
+            return None
+        return (float(self.blackout_starts[i]), float(self.blackout_ends[i]))
+
+    def get_blackouts(self, start: float, end: float) -> 'tuple[np.ndarray, np.ndarray]':
+        """
+        Starts and ends of the blackouts overlapping start to end seconds
+        """
+        first = np.searchsorted(self.blackout_ends, start, "right")
+        last = np.searchsorted(self.blackout_starts, end, "left")
+        return (self.blackout_starts[first:last], self.blackout_ends[first:last])
+
+    def get_blackout_time(self, start: float, end: float) -> float:
+        """
+        Seconds of blackout from start to end seconds
+        """
+        return self.get_blackout_time_until(end) - self.get_blackout_time_until(start)
+
+    def get_blackout_time_until(self, time: float) -> float:
+        # Every blackout that ended by time, plus the part of one going on at time
+        i = np.searchsorted(self.blackout_ends, time, "right")
+        total = self.blackout_time_before[i]
+        if i < len(self.blackout_starts) and self.blackout_starts[i] < time:
+            total += time - self.blackout_starts[i]
+        return float(total)
+
+    def get_availability(self, start: float, end: float) -> float:
+        """
+        Fraction of the time from start to end seconds that the link is up
+        """
+        return 1 - self.get_blackout_time(start, end) / (end - start)
+
+    def get_availability_per_year(self, year: float = 365 * 24 * 60 * 60) -> np.ndarray:
+        """
+        Availability in each full year since the first sample
+        """
+        starts = self.times[0] + year * np.arange(int((self.times[-1] - self.times[0]) // year))
+        return np.array([self.get_availability(start, start + year) for start in starts])
@@ -0,0 +1,354 @@
+import math
+import numpy as np
+
+G = 6.67e-11 # Gravitational Constant (m^3/(kg*s^2))
+AU = 1.5e11 # Astronomical Unit (m)
+DAY_SECONDS = 24*60*60 # 1 day in seconds
+
+# Columns of a StateHistory, in order
+STATE_COLUMNS = ("x", "y", "vx", "vy")
+
+# Samples in each chunk yielded by propagate_chunks()
+CHUNK_SAMPLES = 1024
+
+# Samples handled at once by get_energy_drift(), to bound the size of the pairwise arrays
+ENERGY_CHUNK_SIZE = 4096
+
+# Error tolerance of the adaptive integrator, relative to the largest position and velocity
+RK45_TOLERANCE = 1e-10
+
+# Dormand-Prince 5(4) coefficients
+# https://en.wikipedia.org/wiki/Dormand%E2%80%93Prince_method
+DOPRI_A = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+# Weights of the 5th order solution are the last row of DOPRI_A, these are the 4th order ones
+DOPRI_B4 = (5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40)
+
+
+def get_accelerations(positions: np.ndarray, masses: np.ndarray) -> np.ndarray:
+    """
+    Gravitational acceleration of every body from all of the others, for positions of shape
+    (bodies, 2) and masses of shape (bodies,). All pairs are computed in one broadcast operation.
+
+    a_i = -G * sum_j m_j (r_i - r_j) / |r_i - r_j|^3
+    """
+    # separations[i, j] = r_i - r_j
+    separations = positions[:, None, :] - positions[None, :, :]
+    distances_squared = np.einsum("ijk,ijk->ij", separations, separations)
+    # A body doesn't pull on itself
+    np.fill_diagonal(distances_squared, np.inf)
+    # |sqrt(x^2 + y^2)|^3 = (x^2 + y^2)^1.5
+    weights = masses[None, :] * distances_squared**-1.5
+    return -G * np.einsum("ij,ijk->ik", weights, separations)
+
+
+# Integrators
+# Each one takes the state and the accelerations at the start of the step, and returns the
+# state and accelerations at the end along with the number of force evaluations it made.
+# Handing the accelerations over saves one evaluation per step.
+
+def euler_step(positions, velocities, accelerations, masses, h):
+    """
+    Semi-implicit Euler, first order. 1 force evaluation per step.
+    """
+    velocities = velocities + accelerations * h
+    positions = positions + velocities * h
+    return (positions, velocities, get_accelerations(positions, masses), 1)
+
+
+def leapfrog_step(positions, velocities, accelerations, masses, h):
+    """
+    Leapfrog in kick-drift-kick form (velocity Verlet), second order and symplectic, so the
+    energy error stays bounded instead of drifting. 1 force evaluation per step.
+    """
+    half_velocities = velocities + accelerations * (h / 2)
+    positions = positions + half_velocities * h
+    accelerations = get_accelerations(positions, masses)
+    return (positions, half_velocities + accelerations * (h / 2), accelerations, 1)
+
+
+def rk4_step(positions, velocities, accelerations, masses, h):
+    """
+    Classic fourth order Runge-Kutta. 4 force evaluations per step.
+    """
+    k1_x, k1_v = velocities, accelerations
+    k2_x = velocities + k1_v * (h / 2)
+    k2_v = get_accelerations(positions + k1_x * (h / 2), masses)
+    k3_x = velocities + k2_v * (h / 2)
+    k3_v = get_accelerations(positions + k2_x * (h / 2), masses)
+    k4_x = velocities + k3_v * h
+    k4_v = get_accelerations(positions + k3_x * h, masses)
+
+    positions = positions + (k1_x + 2*k2_x + 2*k3_x + k4_x) * (h / 6)
+    velocities = velocities + (k1_v + 2*k2_v + 2*k3_v + k4_v) * (h / 6)
+    return (positions, velocities, get_accelerations(positions, masses), 4)
+
+
+def dormand_prince_step(positions, velocities, accelerations, masses, h):
+    """
+    One Dormand-Prince 5(4) step. Besides the 5th order result, returns the error estimate
+    relative to the largest position and velocity. 6 force evaluations per step,
+    the last stage is the acceleration at the end of the step.
+    """
+    stage_x = [velocities]
+    stage_v = [accelerations]
+    for weights in DOPRI_A[1:]:
+        x = positions + h * sum(w * k for w, k in zip(weights, stage_x) if w)
+        v = velocities + h * sum(w * k for w, k in zip(weights, stage_v) if w)
+        stage_x.append(v)
+        stage_v.append(get_accelerations(x, masses))
+
+    # The last stage is evaluated at the 5th order solution
+    new_positions, new_velocities = x, v
+    error_x = h * sum((b5 - b4) * k for b5, b4, k in zip(DOPRI_A[-1] + (0,), DOPRI_B4, stage_x) if b5 != b4)
+    error_v = h * sum((b5 - b4) * k for b5, b4, k in zip(DOPRI_A[-1] + (0,), DOPRI_B4, stage_v) if b5 != b4)
+
+    error = max(np.max(np.abs(error_x)) / np.max(np.abs(new_positions)),
+                np.max(np.abs(error_v)) / np.max(np.abs(new_velocities)))
+    return (new_positions, new_velocities, stage_v[-1], 6, error)
+
+
+INTEGRATORS = {
+    "euler": euler_step,
+    "leapfrog": leapfrog_step,
+    "rk4": rk4_step,
+    "rk45": dormand_prince_step,
+}
+
+
+def interpolate_states(s: np.ndarray, h: float, start: tuple, end: tuple) -> 'tuple[np.ndarray, np.ndarray]':
+    """
+    Hermite interpolation between two (positions, velocities, accelerations) states h seconds
+    apart, at the fractions s of the step. Positions use the quintic through the positions,
+    velocities and accelerations, velocities use the cubic through the velocities and accelerations.
+    """
+    s = s[:, None, None]
+    s2, s3 = s**2, s**3
+    s4, s5 = s3 * s, s3 * s2
+    x0, v0, a0 = start
+    x1, v1, a1 = end
+
+    positions = ((1 - 10*s3 + 15*s4 - 6*s5) * x0 + (s - 6*s3 + 8*s4 - 3*s5) * h * v0
+                 + (s2 - 3*s3 + 3*s4 - s5) * (h*h / 2) * a0
+                 + (10*s3 - 15*s4 + 6*s5) * x1 + (-4*s3 + 7*s4 - 3*s5) * h * v1
+                 + (s3 - 2*s4 + s5) * (h*h / 2) * a1)
+    velocities = ((2*s3 - 3*s2 + 1) * v0 + (s3 - 2*s2 + s) * h * a0
+                  + (3*s2 - 2*s3) * v1 + (s3 - s2) * h * a1)
+    return (positions, velocities)
+
+
+class StateHistory:
+    """
+    Positions and velocities of every body, sampled every dt seconds from the start of the
+    propagation. Stored as one preallocated (samples, bodies, 4) array with the columns in
+    STATE_COLUMNS order, float64 by default or float32 to halve the memory.
+
+    x, y, vx and vy are (samples, bodies) views into the array, positions and velocities are
+    (samples, bodies, 2) views, so whole histories can be handed to NumPy without copying.
+
+    Pass data to wrap an existing array instead, for example a memory map (see ephemeris.py).
+    """
+
+    __slots__ = ("data", "dt", "start_time", *STATE_COLUMNS)
+
+    def __init__(self, samples: int, bodies: int, dt: float, dtype=np.float64,
+                 data: "np.ndarray | None" = None, start_time: float = 0.0) -> None:
+        if data is None:
+            data = np.empty((samples, bodies, len(STATE_COLUMNS)), dtype=dtype)
+        self.data = data
+        self.dt = dt
+        self.start_time = start_time
+        for column, name in enumerate(STATE_COLUMNS):
+            setattr(self, name, self.data[:, :, column])
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.data[:, :, 0:2]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self.data[:, :, 2:4]
+
+    @property
+    def times(self) -> np.ndarray:
+        """
+        Time of every sample in seconds since the start of the propagation
+        """
+        return self.start_time + self.dt * np.arange(len(self))
+
+    def window(self, start: float, end: float) -> 'StateHistory':
+        """
+        The samples from start to end seconds, as a view. Only the window is read when the
+        history is memory-mapped.
+        """
+        first = max(0, math.floor((start - self.start_time) / self.dt))
+        last = min(len(self), math.ceil((end - self.start_time) / self.dt) + 1)
+        data = self.data[first:max(first, last)]
+        return StateHistory(*data.shape[:2], self.dt, data=data, start_time=self.start_time + first * self.dt)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+
+def propagate(positions: np.ndarray, velocities: np.ndarray, masses: np.ndarray,
+              dt: float, steps: int, integrator: str = "leapfrog",
+              step_dt: "float | None" = None, tolerance: float = RK45_TOLERANCE,
+              decimation: int = 1, dtype=np.float64,
+              out: "StateHistory | None" = None) -> 'tuple[StateHistory, int]':
+    """
+    Advances all bodies together for steps * dt seconds, sampling their state every dt seconds.
+
+    integrator is one of INTEGRATORS. The fixed step ones step by step_dt seconds (dt by default),
+    "rk45" starts with step_dt and then picks its own step size to keep the error of every step
+    within tolerance.
+    When the steps don't line up with the samples, the samples are interpolated from the
+    steps around them, so a long step_dt saves force evaluations without losing samples.
+
+    Only every decimation-th sample is stored, and the history is stored as dtype. Neither changes
+    the integration itself, which always runs in float64.
+    The samples are written into out if it is given, which must have steps // decimation + 1
+    samples, otherwise into a new StateHistory.
+
+    Returns the StateHistory, starting with the initial state, and the number of force
+    evaluations made.
+    """
+    samples = steps // decimation
+    if out is None:
+        history = StateHistory(samples + 1, len(masses), dt * decimation, dtype)
+    elif out.data.shape != (samples + 1, len(masses), len(STATE_COLUMNS)):
+        raise ValueError(f"Expected a history of shape {(samples + 1, len(masses), len(STATE_COLUMNS))}, got {out.data.shape}")
+    else:
+        history = out
+
+    chunks = propagate_chunks(positions, velocities, masses, dt, steps, integrator, step_dt, tolerance, decimation, dtype)
+    first = 0
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration as done:
+            return (history, done.value)
+        history.data[first:first + len(chunk)] = chunk.data
+        first += len(chunk)
+
+
+def propagate_chunks(positions: np.ndarray, velocities: np.ndarray, masses: np.ndarray,
+                     dt: float, steps: int, integrator: str = "leapfrog",
+                     step_dt: "float | None" = None, tolerance: float = RK45_TOLERANCE,
+                     decimation: int = 1, dtype=np.float64, chunk_samples: int = CHUNK_SAMPLES):
+    """
+    Generator version of propagate(), which yields the history as it is computed, in StateHistory
+    chunks of chunk_samples samples (the last one can be shorter). Each chunk's start_time is the
+    time of its first sample, and only the chunk being filled is kept, so a consumer that only
+    needs recent samples uses bounded memory however long the propagation is.
+
+    The number of force evaluations is the return value of the generator.
+    """
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator {integrator!r}, expected one of {', '.join(INTEGRATORS)}")
+    step = INTEGRATORS[integrator]
+    adaptive = integrator == "rk45"
+
+    positions = np.array(positions, dtype=np.float64)
+    velocities = np.array(velocities, dtype=np.float64)
+    masses = np.asarray(masses, dtype=np.float64)
+
+    sample_dt = dt * decimation
+    samples = steps // decimation
+
+    chunk = StateHistory(min(chunk_samples, samples + 1), len(masses), sample_dt, dtype)
+    chunk_first = 0
+    filled = 0
+
+    def store(new_positions: np.ndarray, new_velocities: np.ndarray):
+        # Copies the next samples into the chunk, yielding every chunk that fills up
+        nonlocal chunk, chunk_first, filled
+        taken = 0
+        while taken < len(new_positions):
+            count = min(len(new_positions) - taken, len(chunk) - filled)
+            chunk.positions[filled:filled + count] = new_positions[taken:taken + count]
+            chunk.velocities[filled:filled + count] = new_velocities[taken:taken + count]
+            filled += count
+            taken += count
+            if filled == len(chunk):
+                yield chunk
+                chunk_first += len(chunk)
+                chunk = StateHistory(min(chunk_samples, samples + 1 - chunk_first), len(masses), sample_dt, dtype,
+                                     start_time=chunk_first * sample_dt)
+                filled = 0
+
+    yield from store(positions[None], velocities[None])
+
+    accelerations = get_accelerations(positions, masses)
+    evaluations = 1
+
+    t = 0.0
+    t_final = samples * sample_dt
+    h = dt if step_dt is None else step_dt
+    sample = 1
+    while sample <= samples:
+        h = min(h, t_final - t)
+        if adaptive:
+            new_positions, new_velocities, new_accelerations, count, error = step(positions, velocities, accelerations, masses, h)
+            evaluations += count
+            error /= tolerance
+            # Shrink the step and try again, or grow it for the next one
+            # https://en.wikipedia.org/wiki/Adaptive_step_size
+            factor = 5 if error == 0 else min(5, max(0.2, 0.9 * error**-0.2))
+            if error > 1:
+                h *= factor
+                continue
+        else:
+            new_positions, new_velocities, new_accelerations, count = step(positions, velocities, accelerations, masses, h)
+            evaluations += count
+
+        # Fill in the samples that fall within this step
+        t_new = t + h
+        last = min(samples, math.floor(t_new / sample_dt + 1e-9))
+        if last >= sample:
+            s = (np.arange(sample, last + 1) * sample_dt - t) / h
+            yield from store(*interpolate_states(
+                s, h, (positions, velocities, accelerations), (new_positions, new_velocities, new_accelerations)))
+            sample = last + 1
+
+        t = t_new
+        positions, velocities, accelerations = new_positions, new_velocities, new_accelerations
+        if adaptive:
+            h *= factor
+
+    return evaluations
+
+
+def get_energy(positions: np.ndarray, velocities: np.ndarray, masses: np.ndarray) -> np.ndarray:
+    """
+    Total (kinetic + potential) energy of the system in J. Any leading axes of positions and
+    velocities, for example the time axis of a history, are kept.
+    """
+    kinetic = 0.5 * np.sum(masses * np.sum(velocities**2, axis=-1), axis=-1)
+
+    i, j = np.triu_indices(len(masses), 1)
+    separations = positions[..., i, :] - positions[..., j, :]
+    distances = np.sqrt(np.sum(separations**2, axis=-1))
+    potential = -G * np.sum(masses[i] * masses[j] / distances, axis=-1)
+
+    return kinetic + potential
+
+
+def get_energy_drift(history: StateHistory, masses: np.ndarray) -> np.ndarray:
+    """
+    Relative energy error |E(t) - E(0)| / |E(0)| at every sample of a history.
+    A good integrator keeps this small and, if it is symplectic, from growing over time.
+    """
+    masses = np.asarray(masses, dtype=np.float64)
+    energies = np.empty(len(history))
+    for start in range(0, len(history), ENERGY_CHUNK_SIZE):
+        end = start + ENERGY_CHUNK_SIZE
+        energies[start:end] = get_energy(history.positions[start:end].astype(np.float64),
+                                         history.velocities[start:end].astype(np.float64), masses)
+    return np.abs(energies - energies[0]) / abs(energies[0])
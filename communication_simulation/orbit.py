@@ -1,17 +1,22 @@
+import math
+import threading
 import matplotlib.pyplot as plt
 from matplotlib import animation
-import matplotlib.gridspec as gridspec
+import numpy as np
+from ephemeris import create_ephemeris, find_ephemeris
+from kepler import KeplerOrbits
+from link_analysis import LinkIndex, analyze_link
+from nbody import AU, DAY_SECONDS, StateHistory, get_energy_drift, propagate, propagate_chunks
+from orbit_renderer import FrameSource, OrbitRenderer, get_paced_frames
 
 # Constants
-G = 6.67e-11 # Gravitational Constant (m^3/(kg*s^2))
-C = 299_792_458 # Speed of Light (m/s)
-AU = 1.5e11 # Astronomical Unit (m)
-DAY_SECONDS = 24*60*60 # 1 day in seconds
-
 SUN_RADIUS = 695_700_000 # Radius of the sun (m)
 EARTH_RADIUS = 6.378e6
 MARS_RADIUS = 3.3895e6
 
+# The Earth-Mars link is blacked out when it passes this close to the center of the sun
+CONJUNCTION_RADIUS = SUN_RADIUS + 2*EARTH_RADIUS
+
 # Globals
 t: float = 0
 # Simulate 2 times a day
@@ -19,35 +24,33 @@ dt: float = DAY_SECONDS / 2
 # Simulate 100 years
 t_end = 100 * 365 * DAY_SECONDS
 
-fig = plt.figure()
-fig.set_size_inches(11, 110/12)
-
-gs = gridspec.GridSpec(2, 2, height_ratios=[3,1])
-gs.update(wspace=0.5)
-
-sim_axis = fig.add_subplot(gs[0, 0:])
-dist_ax = fig.add_subplot(gs[1, 0])
-time_ax = fig.add_subplot(gs[1, 1])
-fig.suptitle("Solar System Simulation")
-# fig, ax = plt.subplots(nrows=2, ncols=1, figsize=(10,8), height_ratios=[3, 1])
-
-sim_axis.set_aspect('equal')
-sim_axis.grid()
-sim_axis.set_facecolor('gray')
-sim_axis.axis('equal')
-sim_axis.set_xlim(-4 * AU, 4 * AU)
-sim_axis.set_ylim(-2 * AU, 2 * AU)
-sim_axis.set_xlabel("Distance (m)")
-sim_axis.set_ylabel("Distance (m)")
-
-dist_ax.grid()
-dist_ax.set_xlabel("Day")
-dist_ax.set_ylabel("Distance between Earth and Mars (m)")
-time_ax.grid()
-time_ax.set_xlabel("Day")
-time_ax.set_ylabel("Time to communicate (min)")
-
-fig.set_facecolor('gray')
+# Integrator used by simulate(), one of nbody.INTEGRATORS, or "kepler" to skip the integration
+# and use the analytic two-body orbits of the planets around the Sun
+# The adaptive rk45 stays within 1e-9 of the exact orbit per step with fewer force
+# evaluations than semi-implicit Euler needs at dt
+INTEGRATOR = "rk45"
+INTEGRATOR_TOLERANCE = 1e-9
+# Step of the fixed step integrators, and the first step of rk45
+INTEGRATOR_STEP = DAY_SECONDS
+# Keep every k-th dt of the state history, stored as float32 to halve its memory or float64
+HISTORY_DECIMATION = 1
+HISTORY_DTYPE = np.float64
+# The state history is kept here and reused by later runs with the same settings
+EPHEMERIS_PATH = "orbit.ephemeris"
+
+# Animation
+# Simulated days shown per second, frames are skipped when drawing can't keep up
+PLAYBACK_DAYS_PER_SECOND = 60
+TARGET_FPS = 30
+# Only redraw what changed between frames
+BLIT = True
+# Set to a directory to render the animation there headlessly, on every core, instead of
+# showing it. It is stitched into a video if ffmpeg is installed
+EXPORT_DIRECTORY = None
+EXPORT_WORKERS = None
+# Start the animation while the orbit is still being propagated on a background thread,
+# when there is no ephemeris to load yet
+STREAM = True
 
 def distance(x1: float, y1: float, x2: float, y2: float) -> float:
     return ((x2 - x1)**2 + (y2 - y1)**2)**0.5
@@ -67,80 +70,176 @@ class Body:
         self.x: float = x0
         self.y: float = y0
 
-        self.xpositions: list[float] = [x0]
-        self.ypositions: list[float] = [y0]
+        # Views into the state history once simulate() has run
+        self.xpositions: np.ndarray = np.array([x0])
+        self.ypositions: np.ndarray = np.array([y0])
 
-        self.xvelocities: list[float] = [vx0]
-        self.yvelocities: list[float] = [vy0]
+        self.xvelocities: np.ndarray = np.array([vx0])
+        self.yvelocities: np.ndarray = np.array([vy0])
 
         self.vx: float = vx0
         self.vy: float = vy0
 
-        self.line, = sim_axis.plot([], [], lw=linewidth, c=color)
-
-        self.point, = sim_axis.plot([x0], [y0], marker="o", markersize=markersize, markeredgecolor=color, markerfacecolor=color)
-        # self.point = plt.Circle((x0, y0), radius, color=color)
-        self.text: plt.text = sim_axis.text(x0, y0, name)
+        # How OrbitRenderer draws the body
+        self.style = {"name": name, "color": color, "linewidth": linewidth, "markersize": markersize}
 
         # Add to the list of celestial bodies
         Body.BodyList.append(self)
 
-        # Gravity constants compared to all of the other bodies
-        self.gravityDict: dict(str, float) = {}
-
-    def update_pos(self) -> None:
-        """
-        Update the position and velocity of the body.
-        
-        F = G(m_1)(m_2)/d^2
-        https://towardsdatascience.com/simulate-a-tiny-solar-system-with-python-fbbb68d8207b
-        """
-        for body in Body.BodyList:
-            if (self == body):
-                continue
-            
-            if (body.name not in self.gravityDict):
-                self.gravityDict[body.name] = G * body.mass * self.mass 
-            
-            gravity_constant = self.gravityDict[body.name]
-
-            x_dist = self.x - body.x
-            y_dist = self.y - body.y
-
-            # |sqrt(x^2 + y^2)|^3 = (x^2 + y^2)^1.5
-            r3: float = ((x_dist)**2 + (y_dist)**2)**1.5
-
-            fx = -gravity_constant*x_dist/r3
-            fy = -gravity_constant*y_dist/r3
-
-            self.vx += fx * dt / self.mass
-            self.vy += fy * dt / self.mass
-            
-        self.x += self.vx * dt
-        self.y += self.vy * dt
-
-        self.xpositions.append(self.x)
-        self.ypositions.append(self.y)
-        self.xvelocities.append(self.vx)
-        self.yvelocities.append(self.vy)
-        pass
-
     def __eq__(self, other):
         if (isinstance(other, Body)):
             return self.name == other.name
         return False
 
-times = []
-
-def simulate():
+times = np.array([])
+
+def get_initial_state() -> 'tuple[int, np.ndarray, np.ndarray, np.ndarray]':
+    """
+    The number of dt steps from t to t_end, and the positions, velocities and masses of
+    Body.BodyList
+    """
+    steps = math.ceil((t_end - t) / dt)
+
+    positions = np.array([[body.x, body.y] for body in Body.BodyList])
+    velocities = np.array([[body.vx, body.vy] for body in Body.BodyList])
+    masses = np.array([body.mass for body in Body.BodyList])
+
+    return (steps, positions, velocities, masses)
+
+def get_ephemeris_args(steps: int, positions: np.ndarray, velocities: np.ndarray,
+                       masses: np.ndarray) -> 'tuple[tuple, dict]':
+    """
+    Arguments of find_ephemeris() and create_ephemeris() for the current settings
+    """
+    ephemeris_args = (
+        EPHEMERIS_PATH, steps // HISTORY_DECIMATION + 1, dt * HISTORY_DECIMATION,
+        [body.name for body in Body.BodyList], masses.tolist(), HISTORY_DTYPE
+    )
+    ephemeris_metadata = {
+        "integrator": INTEGRATOR,
+        "tolerance": INTEGRATOR_TOLERANCE,
+        "step_dt": INTEGRATOR_STEP,
+        "positions": positions.tolist(),
+        "velocities": velocities.tolist(),
+    }
+    return (ephemeris_args, ephemeris_metadata)
+
+def attach_history(history: StateHistory) -> None:
+    """
+    Makes each body's positions and velocities views into history, and moves t to its end
+    """
     global times
     global t
-    # 5 years of time (in seconds)
-    while t < t_end:
-        for body in Body.BodyList:
-            body.update_pos()
-        times.append(t)
-        t += dt
+
+    for i, body in enumerate(Body.BodyList):
+        body.xpositions = history.x[:, i]
+        body.ypositions = history.y[:, i]
+        body.xvelocities = history.vx[:, i]
+        body.yvelocities = history.vy[:, i]
+        body.x, body.y, body.vx, body.vy = history.data[-1, i]
+
+    times = t + history.times
+    t += history.times[-1]
+
+def simulate() -> StateHistory:
+    """
+    Simulate every body in Body.BodyList from t to t_end, and return their state history.
+    Each body's positions and velocities become views into it.
+
+    F = G(m_1)(m_2)/d^2
+    https://towardsdatascience.com/simulate-a-tiny-solar-system-with-python-fbbb68d8207b
+    All bodies are advanced together from the same positions with nbody.propagate(),
+    so the result doesn't depend on the order of Body.BodyList.
+    Prints the number of force evaluations, the largest relative energy error, and how far the
+    planets drift from their Kepler orbits around the Sun, which is what they would follow if
+    they didn't pull on each other.
+    With INTEGRATOR = "kepler" the history is those Kepler orbits instead, see kepler.py.
+
+    The history is written to the memory-mapped ephemeris at EPHEMERIS_PATH. If that already
+    holds a run with the same bodies, initial state and settings, it is opened instead.
+    """
+    steps, positions, velocities, masses = get_initial_state()
+    ephemeris_args, ephemeris_metadata = get_ephemeris_args(steps, positions, velocities, masses)
+    ephemeris = find_ephemeris(*ephemeris_args, **ephemeris_metadata)
+
+    if ephemeris is None:
+        ephemeris = create_ephemeris(*ephemeris_args, **ephemeris_metadata)
+        kepler_orbits = KeplerOrbits(positions, velocities, masses)
+        if INTEGRATOR == "kepler":
+            kepler_orbits.fill_history(ephemeris.history)
+            ephemeris.finish()
+            print(f"kepler: two-body orbits around {Body.BodyList[kepler_orbits.central].name}")
+        else:
+            _, evaluations = propagate(
+                positions, velocities, masses, dt, steps,
+                integrator=INTEGRATOR, step_dt=INTEGRATOR_STEP, tolerance=INTEGRATOR_TOLERANCE,
+                decimation=HISTORY_DECIMATION, out=ephemeris.history
+            )
+            ephemeris.finish()
+            energy_drift = get_energy_drift(ephemeris.history, masses)
+            print(f"{INTEGRATOR}: {evaluations} force evaluations, max energy drift {energy_drift.max():.2e}")
+            deviations = kepler_orbits.get_deviations(ephemeris.history)
+            print("Max deviation from Kepler orbits: " + ", ".join(
+                f"{Body.BodyList[i].name} {deviations[i] / 1000:.0f} km" for i in kepler_orbits.bodies))
+    else:
+        print(f"Loaded {EPHEMERIS_PATH}")
+
+    attach_history(ephemeris.history)
+    return ephemeris.history
+
+def simulate_in_background(earth_index: int, mars_index: int, sun_index: int) -> FrameSource:
+    """
+    Same as simulate(), but if there is no ephemeris to load and INTEGRATOR isn't "kepler", the
+    propagation runs in chunks on a background thread, and the returned FrameSource fills up as
+    it goes. That way the animation can start as soon as the first chunk is done. The source
+    writes the states straight into the ephemeris file, at full speed whatever the playback
+    does, and reads them back from it, so they aren't kept in memory.
+    """
+    steps, positions, velocities, masses = get_initial_state()
+    ephemeris_args, ephemeris_metadata = get_ephemeris_args(steps, positions, velocities, masses)
+    link_args = (earth_index, mars_index, sun_index, CONJUNCTION_RADIUS)
+
+    if INTEGRATOR == "kepler" or find_ephemeris(*ephemeris_args, **ephemeris_metadata) is not None:
+        history = simulate()
+        link = analyze_link(history, *link_args)
+        print_link_summary(history, link)
+        return FrameSource.from_history(history, link)
+
+    ephemeris = create_ephemeris(*ephemeris_args, **ephemeris_metadata)
+    history = ephemeris.history
+    source = FrameSource(history.data, history.dt)
+    chunks = propagate_chunks(
+        positions, velocities, masses, dt, steps,
+        integrator=INTEGRATOR, step_dt=INTEGRATOR_STEP, tolerance=INTEGRATOR_TOLERANCE,
+        decimation=HISTORY_DECIMATION, dtype=HISTORY_DTYPE
+    )
+
+    def run():
+        for chunk in source.feed(chunks, *link_args):
+            pass
+        ephemeris.finish()
+        print(f"Saved {EPHEMERIS_PATH}")
+        print_link_summary(history, source.link)
+
+    # Not a daemon thread, so the ephemeris is still finished for the next run when the window
+    # is closed before the propagation is done
+    threading.Thread(target=run).start()
+
+    attach_history(history)
+    return source
+
+def print_link_summary(history: StateHistory, link: tuple) -> None:
+    earth_mars_distances, earth_mars_delays, earth_mars_blackout, sun_closest_points = link
+
+    # Answers questions like when the next blackout is without going through the frames
+    link_index = LinkIndex(history.times, earth_mars_delays, earth_mars_blackout)
+    yearly_availability = link_index.get_availability_per_year()
+    if len(yearly_availability):
+        availability = f"{yearly_availability.min():.2%} to {yearly_availability.max():.2%} available per year"
+    else:
+        # Runs shorter than a year have no full year to compare
+        availability = f"{link_index.get_availability(history.times[0], history.times[-1]):.2%} available over the run"
+    print(f"Earth-Mars link: {len(link_index.blackout_starts)} solar conjunction blackouts, {availability}")
 
 
 # Runner code
@@ -149,186 +248,51 @@ sun = Body("The Sun", 2.0e30, SUN_RADIUS, 0, 0, 0, 0, "yellow", 1, 7)
 earth = Body("Earth", 5.972e24, EARTH_RADIUS, 1.0167*AU, 0, 0, 29290, "blue", 1, 4)
 mars = Body("Mars", 6.39e23, MARS_RADIUS, 1.666*AU, 0, 0, 21970, "red", 1, 4)
 
-earth_mars_distance, = sim_axis.plot([], [], linestyle="--", color="green", linewidth=2)
-earth_mars_text = sim_axis.text(0, 0, f"Distance: {0:.2f} AU")
-
-sun_distance, = sim_axis.plot([], [], linestyle="--", color="orange", linewidth=1)
-
-# mars_sun_distance, = sim_axis.plot([], [], linestyle="--")
-# mars_sun_text = sim_axis.text(0, 0, f"Distance: {0:.2f} AU")
-
-# mars_vector = sim_axis.plot([], [], linestyle="->")
-mars_vector = sim_axis.arrow(0, 0, 0, 0, head_width=10e9, shape='full', head_starts_at_zero=False, animated=True)
-mars_force_text = sim_axis.text(0, 0, f"Magnitude: {0:.2f}N")
-
-earth_vector = sim_axis.arrow(0, 0, 0, 0, head_width=10e9, shape='full', head_starts_at_zero=False, animated=True)
-earth_force_text = sim_axis.text(0, 0, f"Magnitude: {0:.2f}N")
-
-distance_graph, = dist_ax.plot([], [], linestyle="-", color="blue", linewidth=1)
-time_graph, = time_ax.plot([], [], linestyle="-", color="green", linewidth=1)
-
-def get_mars_earth_distance(i):
-    return ((mars.xpositions[i] - earth.xpositions[i])**2 + (mars.ypositions[i] - earth.ypositions[i])**2)**0.5
-
 def get_mars_sun_distance(i):
     return ((mars.xpositions[i] - sun.xpositions[i])**2 + (mars.ypositions[i] - sun.ypositions[i])**2)**0.5
 
-simulate()
-
-days = [time / DAY_SECONDS for time in times]
-
-
-earth_mars_distances = [get_mars_earth_distance(i) for i in range(len(earth.xpositions))]
-earth_mars_distances_au = [distance / AU for distance in earth_mars_distances]
-earth_mars_times = [distance / C / 60 for distance in earth_mars_distances]
-# mars_sun_distances = [get_mars_sun_distance(i) for i in range(len(mars.xpositions))]
-
-dist_ax.set_ylim(min(earth_mars_distances_au) - 0.5, max(earth_mars_distances_au) + 0.5)
-time_ax.set_ylim(0, 24)
-
-def update_animation(i):
-    output_list = []
-
-    earth_x = earth.xpositions[i]
-    earth_y = earth.ypositions[i]
-    mars_x = mars.xpositions[i]
-    mars_y = mars.ypositions[i]
-    sun_x = sun.xpositions[i]
-    sun_y = sun.ypositions[i]
-
-    curr_earth_mars_distance = earth_mars_distances[i]
-    
-    # https://stackoverflow.com/a/1079478
-
-    earth_sun_x, earth_sun_y = (sun_x - earth_x, sun_y - earth_y)
-    earth_mars_x, earth_mars_y = (mars_x - earth_x, mars_y - earth_y)
 
-    # u * v / |v|**2
-    k = (earth_sun_x*earth_mars_x + earth_sun_y*earth_mars_y)/(earth_mars_x**2 + earth_mars_y**2)
+def main() -> None:
+    earth_index, mars_index, sun_index = (Body.BodyList.index(body) for body in (earth, mars, sun))
+    styles = [body.style for body in Body.BodyList]
 
-    # P_u(v) = v(u * v) / |v|**2
-    projection_x_length, projection_y_length = (earth_mars_x * k, earth_mars_y * k)
-
-    scale = projection_x_length / earth_mars_x if abs(earth_mars_x) > abs(earth_mars_y) else projection_y_length / earth_mars_y
-
-    distance_to_sun = 0
-
-    if (scale < 0):
-        distance_to_sun = 1e30 # Basically infinity, because it's impossible to intersect the sun
-        sun_distance.set_data([earth_x, sun_x], [earth_y, sun_y])
-    elif (scale >= 1):
-        distance_to_sun = 1e30 # Basically infinity, because it's impossible to intersect the sun
-        sun_distance.set_data([mars_x, sun_x], [mars_y, sun_y])
-    else:
-        projection_x = earth_x + projection_x_length
-        projection_y = earth_y + projection_y_length
-        distance_to_sun = ((projection_x - sun_x)**2 + (projection_y - sun_y)**2)**0.5
-        sun_distance.set_data([projection_x_length + earth_x, sun_x], [projection_y_length + earth_y, sun_y])
-    
-    is_conjunction = distance_to_sun < SUN_RADIUS + 2*EARTH_RADIUS
-
-    output_list.append(sun_distance)
-
-    if (not is_conjunction):
-        earth_mars_distance.set(color='green', linestyle='--', linewidth=2)
-        earth_mars_text.set_text(
-            f"Distance:{(curr_earth_mars_distance / AU):.2f} AU\nTime to transmit:{((curr_earth_mars_distance / C)/60):.0f} minutes"
-        )
+    if STREAM and EXPORT_DIRECTORY is None:
+        source = simulate_in_background(earth_index, mars_index, sun_index)
     else:
-        earth_mars_times[i] = 1e10 # basically infinity
-        earth_mars_distance.set(color='red', linestyle='dotted', linewidth=1)
-        earth_mars_text.set_text(
-            f"Distance:{(curr_earth_mars_distance / AU):.2f} AU\nTime to transmit: infinite (solar conjunction)"
-        )
-
-    earth_mars_distance.set_data([earth_x, mars_x], [earth_y, mars_y])
-    output_list.append(earth_mars_distance)
-
-    # mars_sun_distance.set_data([mars_x, sun_x], [mars_y, sun_y])
-    # output_list.append(mars_sun_distance)
-
-    earth_mars_text_x = (2*earth_x + mars_x)/3
-    earth_mars_text_y = (2*earth_y + mars_y)/3
-
-    # mars_sun_text_x = (2*mars_x + sun_x)/3
-    # mars_sun_text_y = (2*mars_y + sun_y)/3
-
-    # curr_mars_sun_distance = mars_sun_distances[i]
-
-    earth_mars_text.set_position((earth_mars_text_x, earth_mars_text_y))
-
-    output_list.append(earth_mars_text)
-
-    # mars_x_force = mars.xvelocities[i] * mars.mass / dt
-    # mars_y_force = mars.yvelocities[i] * mars.mass / dt
-
-    # mars_force_magnitude = (mars_x_force**2 + mars_y_force**2)**0.5
-    mars_velocity_magnitude = (mars.xvelocities[i]**2 + mars.yvelocities[i]**2)**0.5
-
-    mars_vector.set_data(x=mars_x, dx=mars.xvelocities[i]*2e6, y=mars_y, dy=mars.yvelocities[i]*2e6)
-    # mars_force_text.set_text(f"{'%.2e' % mars_force_magnitude} N\n{mars_velocity_magnitude:.2f} m/s")
-    mars_force_text.set_text(f"{mars_velocity_magnitude:.2f} m/s")
-    mars_force_text.set_position((
-        mars.xpositions[i] + mars.xvelocities[i]*3e6, 
-        mars.ypositions[i] + mars.yvelocities[i]*2e6 - 3e10
-    ))
-
-    output_list.append(mars_vector)
-    output_list.append(mars_force_text)
-
-    # earth_x_force = earth.xvelocities[i] * earth.mass / dt
-    # earth_y_force = earth.yvelocities[i] * earth.mass / dt
-
-    # earth_force_magnitude = (earth_x_force**2 + earth_y_force**2)**0.5
-    earth_velocity_magnitude = (earth.xvelocities[i]**2 + earth.yvelocities[i]**2)**0.5
-
-    earth_vector.set_data(x=earth_x, dx=earth.xvelocities[i]*2e6, y=earth_y, dy=earth.yvelocities[i]*2e6)
-    # earth_force_text.set_text(f"{'%.2e' % earth_force_magnitude} N\n{earth_velocity_magnitude:.2f} m/s")
-    earth_force_text.set_text(f"{earth_velocity_magnitude:.2f} m/s")
-    earth_force_text.set_position((
-        earth.xpositions[i] + earth.xvelocities[i]*2e6, 
-        earth.ypositions[i] + earth.yvelocities[i]*2e6 - 3e10
-    ))
-
-    output_list.append(earth_vector)
-    output_list.append(earth_force_text)
-
-    # mars_sun_text.set_text(
-    #     f"Distance:{(curr_mars_sun_distance / AU):.2f} AU")
-    
-    # mars_sun_text.set_position((mars_sun_text_x, mars_sun_text_y))
-
-    # output_list.append(mars_sun_text)
-
-    for body in Body.BodyList:
-        body.line.set_data(body.xpositions[0:i], body.ypositions[0:i])
-        # body.point.set(center=(body.xpositions[i], body.ypositions[i]))
-        # sim_axis.add_patch(body.point)
-        body.point.set_data(body.xpositions[i], body.ypositions[i])
-        body.text.set_position((body.xpositions[i], body.ypositions[i]))
-
-        output_list.append(body.line)
-        output_list.append(body.point)
-        output_list.append(body.text)
-    
-    distance_graph.set_data(days[:i], earth_mars_distances_au[:i])
-    time_graph.set_data(days[:i], earth_mars_times[:i])
-
-    dist_ax.set_xlim(0, days[i] + 1)
-    time_ax.set_xlim(0, days[i] + 1)
-
-    output_list.append(distance_graph)
-    output_list.append(time_graph)
-
-    return output_list
-
-anim = animation.FuncAnimation(
-    fig,
-    func=update_animation,
-    frames=int(t_end / dt),
-    interval=50,
-    blit=False,
-    repeat=False
-)
-
-plt.show()
\ No newline at end of file
+        history = simulate()
+        link = analyze_link(history, earth_index, mars_index, sun_index, CONJUNCTION_RADIUS)
+        # mars_sun_distances = get_mars_sun_distance(slice(None))
+        print_link_summary(history, link)
+
+        if EXPORT_DIRECTORY is not None:
+            # Imported here because it switches matplotlib to the Agg backend
+            from orbit_export import export_animation
+
+            samples_per_frame = max(1, round(PLAYBACK_DAYS_PER_SECOND * DAY_SECONDS / (TARGET_FPS * history.dt)))
+            export_animation(
+                EXPORT_DIRECTORY, EPHEMERIS_PATH, styles, earth_index, mars_index, sun_index, CONJUNCTION_RADIUS,
+                range(0, len(history), samples_per_frame), fps=TARGET_FPS, max_workers=EXPORT_WORKERS
+            )
+            return
+
+        source = FrameSource.from_history(history, link)
+
+    renderer = OrbitRenderer(source, styles, earth_index, mars_index, sun_index)
+
+    # Keep a reference to the animation, or it is garbage collected before it plays
+    anim = animation.FuncAnimation(
+        renderer.fig,
+        func=renderer.draw,
+        init_func=renderer.init,
+        frames=get_paced_frames(source, PLAYBACK_DAYS_PER_SECOND * DAY_SECONDS / source.dt),
+        interval=1000 / TARGET_FPS,
+        blit=BLIT,
+        repeat=False,
+        cache_frame_data=False
+    )
+
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
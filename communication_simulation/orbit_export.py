@@ -0,0 +1,81 @@
+import matplotlib
+# Render without a display, in this process and in the workers
+matplotlib.use("Agg")
+
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from ephemeris import open_ephemeris
+from link_analysis import analyze_link
+from orbit_renderer import FrameSource, OrbitRenderer
+
+# Frames rendered by a worker per task
+FRAMES_PER_TASK = 100
+EXPORT_DPI = 100
+FRAME_PATTERN = "frame_%06d.png"
+
+# Renderer of the worker process, set up once by init_worker()
+worker_renderer: "OrbitRenderer | None" = None
+
+
+def make_renderer(ephemeris_path: str, styles: 'list[dict]', earth: int, mars: int, sun: int,
+                  conjunction_radius: float) -> OrbitRenderer:
+    history = open_ephemeris(ephemeris_path).history
+    link = analyze_link(history, earth, mars, sun, conjunction_radius)
+    return OrbitRenderer(FrameSource.from_history(history, link), styles, earth, mars, sun)
+
+
+def init_worker(*renderer_args) -> None:
+    global worker_renderer
+    worker_renderer = make_renderer(*renderer_args)
+
+
+def render_frames(directory: str, first_frame: int, samples: 'list[int]', dpi: int) -> int:
+    """
+    Draws samples with the worker's renderer into numbered PNGs starting at first_frame
+    """
+    for frame, sample in enumerate(samples, first_frame):
+        worker_renderer.draw(sample)
+        worker_renderer.fig.savefig(os.path.join(directory, FRAME_PATTERN % frame), dpi=dpi,
+                                    facecolor=worker_renderer.fig.get_facecolor())
+    return len(samples)
+
+
+def export_animation(directory: str, ephemeris_path: str, styles: 'list[dict]', earth: int, mars: int, sun: int,
+                     conjunction_radius: float, samples: 'list[int]', fps: float = 30,
+                     max_workers: "int | None" = None, dpi: int = EXPORT_DPI) -> str:
+    """
+    Renders the given samples of a precomputed ephemeris into a numbered image sequence in
+    directory, split over max_workers processes (all cores by default) on the Agg backend.
+    Each worker opens the memory-mapped ephemeris itself, so the history isn't copied to it.
+
+    If ffmpeg is installed, the frames are then stitched into directory + ".mp4" at fps.
+    Returns the path of the video, or of the directory if there is no ffmpeg.
+    """
+    os.makedirs(directory, exist_ok=True)
+    samples = list(samples)
+    renderer_args = (ephemeris_path, styles, earth, mars, sun, conjunction_radius)
+
+    with ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=renderer_args) as executor:
+        futures = [
+            executor.submit(render_frames, directory, first, samples[first:first + FRAMES_PER_TASK], dpi)
+            for first in range(0, len(samples), FRAMES_PER_TASK)
+        ]
+        rendered = sum(future.result() for future in futures)
+    print(f"Rendered {rendered} frames to {directory}")
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return directory
+
+    video = directory.rstrip("/\\") + ".mp4"
+    subprocess.run([
+        ffmpeg, "-y", "-loglevel", "error",
+        "-framerate", str(fps), "-i", os.path.join(directory, FRAME_PATTERN),
+        # H.264 needs even dimensions
+        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+        video,
+    ], check=True)
+    print(f"Wrote {video}")
+    return video
@@ -0,0 +1,286 @@
+import math
+import threading
+import time
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+import numpy as np
+from link_analysis import analyze_link
+from nbody import AU, DAY_SECONDS, StateHistory
+
+# Days of orbit trail drawn behind each body, about one Mars year
+TRAIL_DAYS = 687
+# Most points drawn for one trail or graph, longer ones are decimated
+MAX_LINE_POINTS = 1000
+# Time to communicate shown during a solar conjunction
+BLACKOUT_MINUTES = 1e10 # basically infinity
+
+
+class FrameSource:
+    """
+    Everything OrbitRenderer draws: the state of every body and the Earth-Mars link for each
+    sample, and the graph series over the whole run, decimated to at most max_line_points.
+
+    The samples are added in order with append(), for example by feed() on a background thread
+    while the animation is already playing, and only the samples available so far are drawn.
+    append() never waits for the renderer, so filling the source runs at full speed however far
+    behind playback is. The states can be memory-mapped, like the history of an ephemeris being
+    written, so that memory stays bounded however long the run is.
+    from_history() wraps a finished history instead, without copying it.
+    """
+
+    def __init__(self, states: np.ndarray, dt: float, max_line_points: int = MAX_LINE_POINTS) -> None:
+        # (samples, bodies, 4) array that append() fills in
+        self.states = states
+        self.total_samples = len(states)
+        self.dt = dt
+
+        self.distances = np.empty(self.total_samples)
+        self.delays = np.empty(self.total_samples)
+        self.blackout = np.empty(self.total_samples, dtype=bool)
+        self.closest_points = np.empty((self.total_samples, 2))
+
+        # The graphs keep every graph_stride-th sample. The time to communicate keeps the longest
+        # time of each stretch instead, so short conjunctions still show up
+        self.graph_stride = max(1, math.ceil(self.total_samples / max_line_points))
+        self.graph_days = np.arange(0, self.total_samples, self.graph_stride) * dt / DAY_SECONDS
+        self.graph_distances = np.full(len(self.graph_days), np.nan)
+        self.graph_times = np.full(len(self.graph_days), -np.inf)
+
+        # Samples appended so far
+        self.available = 0
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_history(cls, history: StateHistory, link: tuple, max_line_points: int = MAX_LINE_POINTS) -> 'FrameSource':
+        """
+        A source over a finished history and its link analysis, using their arrays directly
+        """
+        source = cls(history.data, history.dt, max_line_points)
+        source.distances, source.delays, source.blackout, source.closest_points = link
+        source.add_graph_points(0, source.distances, source.delays, source.blackout)
+        source.available = len(history)
+        return source
+
+    @property
+    def link(self) -> tuple:
+        """
+        The link analysis of every sample, like analyze_link() returns, valid up to available
+        """
+        return self.distances, self.delays, self.blackout, self.closest_points
+
+    def add_graph_points(self, first: int, distances: np.ndarray, delays: np.ndarray, blackout: np.ndarray) -> None:
+        samples = first + np.arange(len(distances))
+        on_grid = samples % self.graph_stride == 0
+        self.graph_distances[samples[on_grid] // self.graph_stride] = distances[on_grid] / AU
+        times = np.where(blackout, BLACKOUT_MINUTES, delays / 60)
+        np.maximum.at(self.graph_times, samples // self.graph_stride, times)
+
+    def append(self, states: np.ndarray, link: tuple) -> None:
+        """
+        Adds the next samples: their (samples, bodies, 4) states and their link analysis
+        """
+        first = self.available
+        samples = slice(first, first + len(states))
+        self.states[samples] = states
+        distances, delays, blackout, closest_points = link
+        self.distances[samples] = distances
+        self.delays[samples] = delays
+        self.blackout[samples] = blackout
+        self.closest_points[samples] = closest_points
+        self.add_graph_points(first, distances, delays, blackout)
+
+        with self.condition:
+            self.available = samples.stop
+            self.condition.notify_all()
+
+    def wait_for(self, samples: int) -> None:
+        """
+        Waits until samples samples are available
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= min(samples, self.total_samples))
+
+    def feed(self, chunks, earth: int, mars: int, sun: int, conjunction_radius: float):
+        """
+        Appends the StateHistory chunks of nbody.propagate_chunks() as they come, with their link
+        analysis. Yields every chunk after appending it, for anything else that wants them.
+        """
+        for chunk in chunks:
+            self.append(chunk.data, analyze_link(chunk, earth, mars, sun, conjunction_radius))
+            yield chunk
+
+
+class OrbitRenderer:
+    """
+    The solar system figure: the orbits with the Earth-Mars link on top, and graphs of the
+    Earth-Mars distance and time to communicate below. draw(i) shows sample i of a FrameSource.
+
+    Every frame draws a bounded number of points: the trails only cover the last trail_days, and
+    trails and graphs are decimated to at most max_line_points. The axis limits never change, so
+    the frames can be blitted.
+
+    styles has a dict of name, color, linewidth and markersize per body, and earth, mars and sun
+    are body indices.
+    """
+
+    def __init__(self, source: FrameSource, styles: 'list[dict]', earth: int, mars: int, sun: int,
+                 trail_days: float = TRAIL_DAYS, max_line_points: int = MAX_LINE_POINTS) -> None:
+        self.source = source
+        self.earth, self.mars, self.sun = earth, mars, sun
+
+        self.trail_samples = max(1, round(trail_days * DAY_SECONDS / source.dt))
+        self.trail_stride = max(1, math.ceil(self.trail_samples / max_line_points))
+
+        source.wait_for(1)
+        if source.available == source.total_samples:
+            distance_limits = (np.nanmin(source.graph_distances) - 0.5, np.nanmax(source.graph_distances) + 0.5)
+        else:
+            # The run isn't finished, so allow for the two planets being on opposite sides of the sun
+            sun_x, sun_y = source.states[0, sun, 0:2]
+            farthest = sum(math.hypot(x - sun_x, y - sun_y) for x, y in source.states[0, [earth, mars], 0:2])
+            distance_limits = (-0.5, 1.1 * farthest / AU + 0.5)
+
+        self.fig = plt.figure()
+        self.fig.set_size_inches(11, 110/12)
+
+        gs = gridspec.GridSpec(2, 2, height_ratios=[3,1])
+        gs.update(wspace=0.5)
+
+        self.sim_axis = self.fig.add_subplot(gs[0, 0:])
+        self.dist_ax = self.fig.add_subplot(gs[1, 0])
+        self.time_ax = self.fig.add_subplot(gs[1, 1])
+        self.fig.suptitle("Solar System Simulation")
+
+        self.sim_axis.set_aspect('equal')
+        self.sim_axis.grid()
+        self.sim_axis.set_facecolor('gray')
+        self.sim_axis.axis('equal')
+        self.sim_axis.set_xlim(-4 * AU, 4 * AU)
+        self.sim_axis.set_ylim(-2 * AU, 2 * AU)
+        self.sim_axis.set_xlabel("Distance (m)")
+        self.sim_axis.set_ylabel("Distance (m)")
+
+        self.dist_ax.grid()
+        self.dist_ax.set_xlabel("Day")
+        self.dist_ax.set_ylabel("Distance between Earth and Mars (AU)")
+        self.dist_ax.set_xlim(0, source.graph_days[-1] + 1)
+        self.dist_ax.set_ylim(*distance_limits)
+        self.time_ax.grid()
+        self.time_ax.set_xlabel("Day")
+        self.time_ax.set_ylabel("Time to communicate (min)")
+        self.time_ax.set_xlim(0, source.graph_days[-1] + 1)
+        self.time_ax.set_ylim(0, 24)
+
+        self.fig.set_facecolor('gray')
+
+        self.lines, self.points, self.texts = [], [], []
+        for body, style in enumerate(styles):
+            x0, y0 = source.states[0, body, 0:2]
+            color = style["color"]
+            self.lines.append(self.sim_axis.plot([], [], lw=style["linewidth"], c=color)[0])
+            self.points.append(self.sim_axis.plot(
+                [x0], [y0], marker="o", markersize=style["markersize"], markeredgecolor=color, markerfacecolor=color
+            )[0])
+            self.texts.append(self.sim_axis.text(x0, y0, style["name"]))
+
+        self.earth_mars_distance, = self.sim_axis.plot([], [], linestyle="--", color="green", linewidth=2)
+        self.earth_mars_text = self.sim_axis.text(0, 0, f"Distance: {0:.2f} AU")
+
+        self.sun_distance, = self.sim_axis.plot([], [], linestyle="--", color="orange", linewidth=1)
+
+        self.mars_vector = self.sim_axis.arrow(0, 0, 0, 0, head_width=10e9, shape='full', head_starts_at_zero=False, animated=True)
+        self.mars_velocity_text = self.sim_axis.text(0, 0, f"{0:.2f} m/s")
+
+        self.earth_vector = self.sim_axis.arrow(0, 0, 0, 0, head_width=10e9, shape='full', head_starts_at_zero=False, animated=True)
+        self.earth_velocity_text = self.sim_axis.text(0, 0, f"{0:.2f} m/s")
+
+        self.distance_graph, = self.dist_ax.plot([], [], linestyle="-", color="blue", linewidth=1)
+        self.time_graph, = self.time_ax.plot([], [], linestyle="-", color="green", linewidth=1)
+
+        # Everything draw() changes, for blitting
+        self.artists = [
+            self.sun_distance, self.earth_mars_distance, self.earth_mars_text,
+            self.mars_vector, self.mars_velocity_text, self.earth_vector, self.earth_velocity_text,
+            *self.lines, *self.points, *self.texts,
+            self.distance_graph, self.time_graph,
+        ]
+
+    def init(self) -> list:
+        """
+        Empty first frame, the init_func of FuncAnimation
+        """
+        return self.artists
+
+    def draw(self, i: int) -> list:
+        """
+        Updates the figure to sample i and returns the artists that changed
+        """
+        source = self.source
+        earth_x, earth_y, earth_vx, earth_vy = source.states[i, self.earth]
+        mars_x, mars_y, mars_vx, mars_vy = source.states[i, self.mars]
+        sun_x, sun_y = source.states[i, self.sun, 0:2]
+
+        curr_earth_mars_distance = source.distances[i]
+
+        # Line from the sun to the closest point of the Earth-Mars link
+        closest_x, closest_y = source.closest_points[i]
+        self.sun_distance.set_data([closest_x, sun_x], [closest_y, sun_y])
+
+        if (not source.blackout[i]):
+            self.earth_mars_distance.set(color='green', linestyle='--', linewidth=2)
+            self.earth_mars_text.set_text(
+                f"Distance:{(curr_earth_mars_distance / AU):.2f} AU\nTime to transmit:{(source.delays[i]/60):.0f} minutes"
+            )
+        else:
+            self.earth_mars_distance.set(color='red', linestyle='dotted', linewidth=1)
+            self.earth_mars_text.set_text(
+                f"Distance:{(curr_earth_mars_distance / AU):.2f} AU\nTime to transmit: infinite (solar conjunction)"
+            )
+
+        self.earth_mars_distance.set_data([earth_x, mars_x], [earth_y, mars_y])
+        self.earth_mars_text.set_position(((2*earth_x + mars_x)/3, (2*earth_y + mars_y)/3))
+
+        self.mars_vector.set_data(x=mars_x, dx=mars_vx*2e6, y=mars_y, dy=mars_vy*2e6)
+        self.mars_velocity_text.set_text(f"{math.hypot(mars_vx, mars_vy):.2f} m/s")
+        self.mars_velocity_text.set_position((mars_x + mars_vx*3e6, mars_y + mars_vy*2e6 - 3e10))
+
+        self.earth_vector.set_data(x=earth_x, dx=earth_vx*2e6, y=earth_y, dy=earth_vy*2e6)
+        self.earth_velocity_text.set_text(f"{math.hypot(earth_vx, earth_vy):.2f} m/s")
+        self.earth_velocity_text.set_position((earth_x + earth_vx*2e6, earth_y + earth_vy*2e6 - 3e10))
+
+        # Trails over the last trail_samples samples, on a fixed grid of samples so that
+        # decimated trails don't shimmer from frame to frame
+        start = max(0, i - self.trail_samples)
+        start -= start % self.trail_stride
+        trails = source.states[start:i + 1:self.trail_stride]
+        for body, (line, point, text) in enumerate(zip(self.lines, self.points, self.texts)):
+            line.set_data(trails[:, body, 0], trails[:, body, 1])
+            x, y = source.states[i, body, 0:2]
+            point.set_data([x], [y])
+            text.set_position((x, y))
+
+        graph_points = i // source.graph_stride + 1
+        self.distance_graph.set_data(source.graph_days[:graph_points], source.graph_distances[:graph_points])
+        self.time_graph.set_data(source.graph_days[:graph_points], source.graph_times[:graph_points])
+
+        return self.artists
+
+
+def get_paced_frames(source: FrameSource, frames_per_second: float):
+    """
+    Frame numbers for FuncAnimation that play the samples of source at frames_per_second samples
+    per second of wall-clock time. Whenever drawing falls behind, the samples in between are
+    skipped rather than slowing playback down. Playback waits, showing the last available sample,
+    whenever it catches up with a source that is still being filled.
+    """
+    start = time.perf_counter()
+    i = 0
+    while True:
+        yield i
+        if i == source.total_samples - 1:
+            return
+        i = min(max(i + 1, int((time.perf_counter() - start) * frames_per_second)), source.total_samples - 1)
+        if i >= source.available:
+            i = max(0, source.available - 1)
+            # Carry on from here once there is more, rather than jumping ahead
+            start = time.perf_counter() - i / frames_per_second
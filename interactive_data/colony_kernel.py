@@ -0,0 +1,395 @@
+import numpy as np
+from scenario import DEFAULT_SCENARIO, Scenario
+from trajectory import TRAJECTORY_METRICS
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Whether the kernel is compiled. Otherwise simulate_colony() runs run_colony_vectorized(),
+# which gives the same results about 25x slower
+COMPILED = numba is not None
+
+# SplitMix64 works on unsigned 64 bit integers
+UINT64_MASK = 2**64 - 1
+
+# The colony model shared by simulation.py, data_generation.py and the notebooks.
+# With Numba installed, it is compiled to machine code on first use (and cached on disk),
+# otherwise simulate_colony() runs the same model with numpy, see run_colony_vectorized().
+if numba is not None:
+    jit = numba.njit(cache=True)
+
+    @jit
+    def make_stream(seed: int) -> np.ndarray:
+        # State of a SplitMix64 generator, which is several times faster than Numba's np.random
+        # and so matters here, with most of the time going into drawing deviations
+        return np.full(1, seed, dtype=np.uint64)
+
+    @jit
+    def uniform(stream: np.ndarray) -> float:
+        """
+        Uniform on [0, 1) from a stream made by make_stream()
+        https://prng.di.unimi.it/splitmix64.c
+        """
+        stream[0] += np.uint64(0x9E3779B97F4A7C15)
+        z = stream[0]
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+        # Top 53 bits, as many as a float64 holds
+        return (z >> np.uint64(11)) * (1.0 / 2**53)
+else:
+    def jit(function):
+        return function
+
+    # The same SplitMix64 generator in plain Python, so a seed gives the same colony either way
+    def make_stream(seed: int) -> 'list[int]':
+        return [int(seed) & UINT64_MASK]
+
+    def uniform(stream: 'list[int]') -> float:
+        z = stream[0] = (stream[0] + 0x9E3779B97F4A7C15) & UINT64_MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & UINT64_MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & UINT64_MASK
+        return ((z ^ (z >> 31)) >> 11) * (1.0 / 2**53)
+
+
+@jit
+def get_recycle_percentage(stream, recycle_percentage: float) -> float:
+    """
+    Recycling has a maximum of 85% efficiency, but some of the recycling machines may break, decreasing efficiency (temporarily)
+    """
+    return (recycle_percentage + (uniform(stream) * 0.1) - 0.05)
+
+
+# Returns a random percentage up to 10% to indicate alteration
+@jit
+def get_water_deviation(stream) -> float:
+    #-5% to 5% deviation
+    return uniform(stream) * 0.2 - 0.1
+
+
+# Returns the water usage for an individual with the alterations accounted for
+@jit
+def get_individual_water_usage(stream, base_water: float) -> float:
+    return base_water * (1 + get_water_deviation(stream))
+
+
+@jit
+def record_day(trajectory: np.ndarray, index: int, water_stored: float, water_used: float, water_lost: float,
+               water_recycled: float, water_gained: float) -> None:
+    # Same as Trajectory.record(), in TRAJECTORY_METRICS order
+    trajectory[0, index] = water_stored
+    trajectory[1, index] = water_used
+    trajectory[2, index] = water_lost
+    trajectory[3, index] = water_recycled
+    trajectory[4, index] = water_gained
+
+
+@jit
+def run_colony(water_mined_per_day: float, seed: int, flight_days: int, colony_days: int, num_people: int,
+               start_water: float, water_ration_threshold: float, max_water_stored: float,
+               recycle_percentage: float, mining_fail_chance: float, mining_setup_period: int,
+               days_until_farming: int, farming_water_used: float,
+               trajectory: np.ndarray) -> 'tuple[bool, float, int, int]':
+    """
+    Simulates one colony with the random stream of seed, taking the scenario as plain numbers
+    so it can be compiled. Use simulate_colony() instead.
+
+    Every day that is run is recorded into trajectory, a (len(TRAJECTORY_METRICS), days) array,
+    unless it has no columns. Returns (survived, water_stored, days_survived, days_run), where
+    days_run also counts the day on which the water ran out during the flight.
+
+    Every day makes the same draws whatever the state of the colony: each person draws all of
+    their activity deviations and uses the ones their ration tier and schedule need, and the
+    length and severity of a machine failure are drawn whether one happens or not. That way the
+    same seed gives the same draws at any mining rate or scenario with the same number of people,
+    which common random numbers rely on.
+    """
+    stream = make_stream(seed)
+    record = trajectory.shape[1] > 0
+
+    water_stored = start_water
+    failed = False
+    days_survived = 0
+    days_run = 0
+
+    # During Flight
+    for day in range(1, flight_days + 1):
+        if failed:
+            break
+        failed = water_stored <= 0
+        if not failed:
+            days_survived += 1
+
+        water_used_today = 0.0
+        water_recycled_today = 0.0
+
+        for x in range(num_people):
+            # ISS Astronauts use 3 gal per day
+            individual_water = get_individual_water_usage(stream, 3)
+            water_used_today += individual_water
+            water_recycled_today += get_recycle_percentage(stream, recycle_percentage) * individual_water
+
+        water_lost_today = water_used_today - water_recycled_today
+
+        water_stored -= water_lost_today
+        water_stored = max(water_stored, 0)
+
+        if record:
+            record_day(trajectory, days_run, water_stored, water_used_today, water_lost_today, water_recycled_today, 0)
+        days_run += 1
+
+    days_failing = 0
+    fail_percent = 0.0
+    mining_efficiency = 1.0
+
+    # During Colonization
+    for day in range(1, colony_days + 1):
+        if failed:
+            break
+
+        days_survived += 1
+        failed = water_stored <= 0
+        water_used_today = 0.0
+        water_recycled_today = 0.0
+
+        for x in range(num_people):
+            # Colonists split up water rations over a schedule
+            cycle = x + day
+            # Deviations of the daily needs, shower, washing machine and dishwasher
+            needs_deviation = get_water_deviation(stream)
+            shower_deviation = get_water_deviation(stream)
+            washing_deviation = get_water_deviation(stream)
+            dishes_deviation = get_water_deviation(stream)
+            if water_stored < water_ration_threshold:
+                # 2.5 gal hygiene
+                # 1 gal drinking
+                individual_water = 3.5 * (1 + needs_deviation)
+                if cycle % 3 == 0:
+                    # shower (20 gal) (every 3 days)
+                    individual_water += 20 * (1 + shower_deviation)
+                if cycle % 4 == 0:
+                    # Washing machine (15 gal) (every 4 days)
+                    individual_water += 15 * (1 + washing_deviation)
+                if cycle % 2 == 0:
+                    # Dishwasher (5 gal) (every 2 days)
+                    individual_water += 5 * (1 + dishes_deviation)
+            elif water_stored < start_water:
+                # if there is nearly no water, cut water usage to only basic needs
+                individual_water = 3.5 * (1 + needs_deviation)
+            else:
+                # 5 gal dishwasher
+                # 20 gal shower
+                # space toilet = no water
+                # 2.5 gal hygiene
+                # 1 gal drinking
+                individual_water = (5 + 20 + 2.5 + 1) * (1 + needs_deviation)
+                if cycle % 4 == 0:
+                    # Washing machine (15 gal) (every 4 days)
+                    individual_water += 15 * (1 + washing_deviation)
+            water_used_today += individual_water
+            water_recycled_today += individual_water * get_recycle_percentage(stream, recycle_percentage)
+
+        if day > days_until_farming:
+            water_used_today += farming_water_used
+
+        water_lost_today = water_used_today - water_recycled_today
+
+        # Mining productivity goes up 5% at a time for the first 30 days
+        setup_factor = round(min(1, day / mining_setup_period) * 20) / 20
+
+        # 20% deviation in mining + setup factor
+        water_mined_today = water_mined_per_day * (1 + uniform(stream) * 0.4 - 0.2) * setup_factor * mining_efficiency
+
+        # Mining efficiency will vary by up to +-5%
+        mining_efficiency += (uniform(stream) * 0.1 - 0.05)
+        # Mining efficiency goes from 20 - 100%
+        mining_efficiency = max(min(1, mining_efficiency), 0.2)
+
+        # A machine can fail for up to 5 days. How long and how badly are drawn every day,
+        # failure or not
+        machine_failed = uniform(stream) < mining_fail_chance
+        new_days_failing = int(uniform(stream) * 5) + 1
+        new_fail_percent = uniform(stream)
+        if machine_failed:
+            days_failing = new_days_failing
+            fail_percent = new_fail_percent
+
+        if (days_failing > 0):
+            water_mined_today *= fail_percent
+            days_failing -= 1
+
+        water_stored += water_mined_today - water_lost_today
+        # Stop water stored from exceeding max
+        water_stored = min(water_stored, max_water_stored)
+        water_stored = max(water_stored, 0)
+
+        if record:
+            record_day(trajectory, days_run, water_stored, water_used_today, water_lost_today, water_recycled_today,
+                       water_mined_today)
+        days_run += 1
+
+    return (not failed, water_stored, days_survived, days_run)
+
+
+def get_uniforms(seed: int, count: int) -> np.ndarray:
+    """
+    The first count draws of uniform() from make_stream(seed), all at once. SplitMix64 only adds
+    a constant to its state for every draw, so every draw can be computed from its position.
+    """
+    z = np.uint64(seed) + np.arange(1, count + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)) * (1.0 / 2**53)
+
+
+def add_people(values: np.ndarray) -> np.ndarray:
+    """
+    Sums a (days, people) array over the people one at a time, in the same order and so with the
+    same rounding as the loops of run_colony()
+    """
+    total = np.zeros(len(values))
+    for x in range(values.shape[1]):
+        total += values[:, x]
+    return total
+
+
+def run_colony_vectorized(water_mined_per_day: float, seed: int, flight_days: int, colony_days: int,
+                          num_people: int, start_water: float, water_ration_threshold: float,
+                          max_water_stored: float, recycle_percentage: float, mining_fail_chance: float,
+                          mining_setup_period: int, days_until_farming: int, farming_water_used: float,
+                          trajectory: np.ndarray) -> 'tuple[bool, float, int, int]':
+    """
+    Same as run_colony(), with the same results, for when it can't be compiled.
+
+    Every day makes the same draws (see run_colony()), so all of them are made up front with
+    get_uniforms(), and the water each person uses and recycles is worked out with numpy for
+    every day and every ration tier at once. Only the water stored, which picks the tier, and
+    the mining are then stepped through day by day in plain Python.
+    """
+    draws_per_colony_day = 5 * num_people + 5
+    uniforms = get_uniforms(seed, 2 * num_people * flight_days + draws_per_colony_day * colony_days)
+    flight_draws = uniforms[:2 * num_people * flight_days].reshape(flight_days, num_people, 2)
+    colony_draws = uniforms[2 * num_people * flight_days:].reshape(colony_days, draws_per_colony_day)
+    person_draws = colony_draws[:, :5 * num_people].reshape(colony_days, num_people, 5)
+    mining_draws = colony_draws[:, 5 * num_people:]
+
+    # ISS Astronauts use 3 gal per day
+    individual_water = 3 * (1 + (flight_draws[:, :, 0] * 0.2 - 0.1))
+    flight_used = add_people(individual_water).tolist()
+    flight_recycled = add_people((recycle_percentage + flight_draws[:, :, 1] * 0.1 - 0.05)
+                                 * individual_water).tolist()
+
+    # Deviations of the daily needs, shower, washing machine and dishwasher, and the recycled share
+    needs, shower, washing, dishes = (1 + (person_draws[:, :, i] * 0.2 - 0.1) for i in range(4))
+    recycled_shares = recycle_percentage + person_draws[:, :, 4] * 0.1 - 0.05
+    cycles = np.arange(1, colony_days + 1)[:, None] + np.arange(num_people)
+    basic_water = 3.5 * needs
+    washing_water = np.where(cycles % 4 == 0, 15 * washing, 0)
+    # Water per person in each tier: rationing, nearly no water and normal, as in run_colony()
+    tier_water = (
+        basic_water + np.where(cycles % 3 == 0, 20 * shower, 0) + washing_water
+        + np.where(cycles % 2 == 0, 5 * dishes, 0),
+        basic_water,
+        (5 + 20 + 2.5 + 1) * needs + washing_water,
+    )
+    colony_used = [add_people(water).tolist() for water in tier_water]
+    colony_recycled = [add_people(water * recycled_shares).tolist() for water in tier_water]
+
+    mining_deviations = (1 + mining_draws[:, 0] * 0.4 - 0.2).tolist()
+    efficiency_changes = (mining_draws[:, 1] * 0.1 - 0.05).tolist()
+    machine_failures = (mining_draws[:, 2] < mining_fail_chance).tolist()
+    failure_days = (mining_draws[:, 3] * 5).astype(np.int64).tolist()
+    failure_percents = mining_draws[:, 4].tolist()
+
+    # Recorded metrics, in TRAJECTORY_METRICS order
+    record = trajectory.shape[1] > 0
+    metrics = ([], [], [], [], [])
+
+    water_stored = start_water
+    failed = False
+    days_survived = 0
+    days_run = 0
+
+    # During Flight
+    for day in range(flight_days):
+        if failed:
+            break
+        failed = water_stored <= 0
+        if not failed:
+            days_survived += 1
+
+        water_lost_today = flight_used[day] - flight_recycled[day]
+        water_stored = max(water_stored - water_lost_today, 0)
+
+        if record:
+            for values, value in zip(metrics, (water_stored, flight_used[day], water_lost_today,
+                                               flight_recycled[day], 0)):
+                values.append(value)
+        days_run += 1
+
+    days_failing = 0
+    fail_percent = 0.0
+    mining_efficiency = 1.0
+
+    # During Colonization
+    for day in range(1, colony_days + 1):
+        if failed:
+            break
+
+        days_survived += 1
+        failed = water_stored <= 0
+        tier = 0 if water_stored < water_ration_threshold else 1 if water_stored < start_water else 2
+        water_used_today = colony_used[tier][day - 1]
+        water_recycled_today = colony_recycled[tier][day - 1]
+
+        if day > days_until_farming:
+            water_used_today += farming_water_used
+
+        water_lost_today = water_used_today - water_recycled_today
+
+        setup_factor = round(min(1, day / mining_setup_period) * 20) / 20
+        water_mined_today = water_mined_per_day * mining_deviations[day - 1] * setup_factor * mining_efficiency
+        mining_efficiency = max(min(1, mining_efficiency + efficiency_changes[day - 1]), 0.2)
+
+        if machine_failures[day - 1]:
+            days_failing = failure_days[day - 1] + 1
+            fail_percent = failure_percents[day - 1]
+
+        if days_failing > 0:
+            water_mined_today *= fail_percent
+            days_failing -= 1
+
+        water_stored = max(min(water_stored + (water_mined_today - water_lost_today), max_water_stored), 0)
+
+        if record:
+            for values, value in zip(metrics, (water_stored, water_used_today, water_lost_today,
+                                               water_recycled_today, water_mined_today)):
+                values.append(value)
+        days_run += 1
+
+    if record:
+        trajectory[:, :days_run] = metrics
+    return (not failed, water_stored, days_survived, days_run)
+
+
+def simulate_colony(water_mined_per_day: float, seed: int, scenario: Scenario = DEFAULT_SCENARIO,
+                    trajectory: "np.ndarray | None" = None) -> 'tuple[bool, float, int, int]':
+    """
+    Simulates one colony of scenario with the random stream of seed (0 to 2**64 - 1), see
+    run_colony(). Pass a trajectory.Trajectory's data as trajectory to record its daily metrics.
+    """
+    if trajectory is None:
+        trajectory = np.empty((len(TRAJECTORY_METRICS), 0))
+    if numba is not None:
+        # Always the same type, so run_colony() is only compiled once
+        seed = np.uint64(seed)
+    run = run_colony if COMPILED else run_colony_vectorized
+    survived, water_stored, days_survived, days_run = run(
+        float(water_mined_per_day), seed, scenario.flight_days, scenario.colony_days, scenario.num_people,
+        scenario.start_water, scenario.water_ration_threshold, scenario.max_water_stored,
+        scenario.recycle_percentage, scenario.mining_fail_chance, scenario.mining_setup_period,
+        scenario.days_until_farming, scenario.farming_water_used, trajectory)
+    return (bool(survived), float(water_stored), int(days_survived), int(days_run))
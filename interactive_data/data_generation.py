@@ -1,261 +1,842 @@
+import itertools
+import math
+import os
 import random
-import matplotlib.pyplot as plt
-
-def liters_to_gal(liters: float) -> float:
-    return liters / 3.78541
-
-# Time
-FLIGHT_DAYS: int = 214
-COLONY_DAYS: int = 3650
-
-NUM_PEOPLE = 20
-
-# ISS has 1920 liters of water for 7 people for 3 months
-# https://ntrs.nasa.gov/api/citations/20180006341/downloads/20180006341.pdf
-START_WATER = (7/3) * liters_to_gal(1920 * (NUM_PEOPLE / 7))
-
-# https://www.nasa.gov/sites/default/files/atoms/files/mars_ice_drilling_assessment_v6_for_public_release.pdf
-MAX_WATER_STORED = (NUM_PEOPLE) * liters_to_gal(1000 * 20)
-
-END_OF_WATER_RATIONING = 60
-
-MINING_FAIL_CHANCE = 0.05
-
-MINING_SETUP_PERIOD = 60
-DAYS_UNTIL_FARMING = 60
-FARMING_WATER_USED = 140 / 7 # Soybeans require 140 gal per week
-
-WATER_RATION_THRESHOLD = START_WATER * 2
-
-RECYCLE_PERCENTAGE: float = 0.85
-water_stored: float = START_WATER
-
-# Water Extraction
-total_water_gained: int = 0
-
-# Simulation
-current_water = 0
-
-
-def get_recycle_percentage() -> float:
-    return (RECYCLE_PERCENTAGE + (random.random() * 0.1) - 0.05)
-
-
-# Returns a random percentage up to 10% to indicate alteration
-def get_water_deviation() -> float:
-    #-5% to 5% deviation
-    return random.random() * 0.2 - 0.1
-
-    # Returns the water usage for an individual with the alterations accounted for
-
-
-def get_individual_water_usage(base_water: float) -> float:
-    return base_water * (1 + get_water_deviation())
-
-
-def get_individual_space_water_usage() -> "tuple[float, float]":
-    water_used = 0
-    water_recycled = 0
-
-    # ISS Astronauts use 3 gal per day
-    water_used = 3
-    water_used *= (1 + get_water_deviation())
-    water_recycled = get_recycle_percentage() * water_used
-
-    return (water_used, water_recycled)
-
-def simulate(water_mined_per_day: float) -> 'tuple(bool, float, float)':
-    total_water_used = 0
-    total_water_lost = 0
-    total_water_recycled = 0
-    total_water_gained = 0
-    water_stored = 0
-
-    failed :bool = False
-
-    water_stored = START_WATER
-    days_survived = 0
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from statistics import NormalDist
+import numpy as np
+from colony_kernel import COMPILED, simulate_colony
+from result_cache import ResultCache
+from scenario import DEFAULT_SCENARIO, Scenario
+from trial_stats import BAND_PERCENTILES, TrialStats
+
+def get_seed_sequence(seed: int, *key: int) -> np.random.SeedSequence:
+    """
+    Returns the random stream identified by key (for example a mining rate key and a trial
+    number) under the master seed. The same seed and key always give the same stream, and
+    different keys give independent streams.
+    """
+    return np.random.SeedSequence(seed, spawn_key=key)
+
+
+def make_trial_rng(seed: int, *key: int) -> random.Random:
+    """
+    Returns a random.Random for a single trial of simulate(), seeded from get_seed_sequence()
+    """
+    return random.Random(int.from_bytes(get_seed_sequence(seed, *key).generate_state(4).tobytes(), "little"))
+
+
+def simulate(water_mined_per_day: float, rng: "random.Random | None" = None,
+             scenario: Scenario = DEFAULT_SCENARIO) -> 'tuple(bool, float, float)':
+    """
+    Simulates one colony with colony_kernel.simulate_colony(), seeded from rng.
+    Pass a generator from make_trial_rng() as rng to make the trial reproducible.
+    """
+    if rng is None:
+        rng = random.Random()
+
+    survived, water_stored, days_survived, _ = simulate_colony(water_mined_per_day, rng.getrandbits(64), scenario)
+    return (survived, water_stored, days_survived)
+
+@dataclass(frozen=True, slots=True)
+class Sampling:
+    """
+    How a sweep draws its trials.
+
+    With common_random_numbers, trial k uses the same random stream at every mining rate instead
+    of a stream of its own per rate, so the differences between rates aren't hidden by different
+    draws. With antithetic, the second half of the lanes of each batch chunk mirrors the draws of
+    the first half (u and 1 - u), so their errors partly cancel. Antithetic pairing needs the batch
+    or aggregate engine.
+    """
+
+    common_random_numbers: bool = False
+    antithetic: bool = False
+
+
+DEFAULT_SAMPLING = Sampling()
+
+
+class AntitheticGenerator:
+    """
+    Wraps a np.random.Generator so that every draw fills the first half of the lanes (the last
+    axis) and mirrors it into the second half: u into 1 - u, k into low + high - 1 - k and z into
+    -z. Only has the methods simulate_batch() uses. With an odd number of lanes, the last one
+    is left unpaired.
+    """
+
+    def __init__(self, rng: "np.random.Generator") -> None:
+        self.rng = rng
+
+    def draw_pairs(self, size: "int | tuple[int, ...]", draw, reflect) -> np.ndarray:
+        shape = (size,) if isinstance(size, int) else tuple(size)
+        lanes = shape[-1]
+        half = draw(shape[:-1] + ((lanes + 1) // 2,))
+        return np.concatenate((half, reflect(half)), axis=-1)[..., :lanes]
+
+    def random(self, size: "int | tuple[int, ...]", dtype=np.float64) -> np.ndarray:
+        return self.draw_pairs(size, lambda shape: self.rng.random(shape, dtype=dtype), lambda u: 1 - u)
+
+    def integers(self, low: int, high: int, size: "int | tuple[int, ...]") -> np.ndarray:
+        return self.draw_pairs(size, lambda shape: self.rng.integers(low, high, shape), lambda k: low + high - 1 - k)
+
+    def normal(self, loc: np.ndarray, scale: np.ndarray) -> np.ndarray:
+        z = self.draw_pairs(np.shape(loc), self.rng.standard_normal, np.negative)
+        return loc + scale * z
+
+
+def get_uniform_batch(rng: "np.random.Generator", shape: "tuple[int, ...]") -> np.ndarray:
+    """
+    Per-person draws only need to be accurate to a fraction of a percent, so they are drawn
+    as float32, which is about twice as fast as float64 for large batches
+    """
+    return rng.random(shape, dtype=np.float32)
+
+
+# Each activity uses (0.9 + 0.2u) times its base water and each person recycles (r + 0.1v) of
+# their water, with u, v uniform on [0, 1). These are the variances of the two deviations
+ACTIVITY_DEVIATION_VARIANCE = 0.2**2 / 12
+RECYCLE_DEVIATION_VARIANCE = 0.1**2 / 12
+
+# The colony schedule repeats every 12 days (showers every 3, laundry every 4, dishes every 2),
+# so people fall into 12 schedule classes by (person + day) % 12
+SCHEDULE_PERIOD = 12
+# Activities done by each schedule class: base usage, shower, washing machine, dishwasher
+SCHEDULE_ACTIVITIES = np.array([
+    [1, cycle % 3 == 0, cycle % 4 == 0, cycle % 2 == 0] for cycle in range(SCHEDULE_PERIOD)
+], dtype=np.float64)
+# Gallons of each activity in the rationing, basic needs only and normal ration tiers
+TIER_ACTIVITY_WATER = np.array([
+    [3.5, 20, 15, 5],
+    [3.5, 0, 0, 0],
+    [5 + 20 + 2.5 + 1, 0, 15, 0],
+])
+
+
+def get_water_lost_moments(activity_water: np.ndarray, min_recycle_percentage: float) -> 'tuple[np.ndarray, np.ndarray]':
+    """
+    Mean and variance of the water one person loses in a day (used minus recycled), where
+    activity_water holds the base gallons of each of their activities along the last axis.
+    Exact for the deviations of simulate(), where every activity and the recycling deviate
+    independently.
+    """
+    # Water used, W = sum of b * (0.9 + 0.2u)
+    used_mean = activity_water.sum(axis=-1)
+    used_square = ACTIVITY_DEVIATION_VARIANCE * (activity_water**2).sum(axis=-1) + used_mean**2
+    # Fraction of it lost, K = 1 - r - 0.1v, independent of W
+    lost_fraction = 1 - min_recycle_percentage - 0.05
+    lost_fraction_square = RECYCLE_DEVIATION_VARIANCE + lost_fraction**2
+
+    lost_mean = used_mean * lost_fraction
+    return (lost_mean, used_square * lost_fraction_square - lost_mean**2)
+
+
+def get_schedule_class_sizes(num_people: int, day: int) -> np.ndarray:
+    """
+    Number of colonists in each schedule class on day, without going through the colonists
+    """
+    # Person x is in class (x + day) % SCHEDULE_PERIOD
+    first_people = (np.arange(SCHEDULE_PERIOD) - day) % SCHEDULE_PERIOD
+    return num_people // SCHEDULE_PERIOD + (first_people < num_people % SCHEDULE_PERIOD)
+
+
+def get_aggregate_water_lost(rng: "np.random.Generator", mean: np.ndarray, variance: np.ndarray) -> np.ndarray:
+    """
+    Draws the water a whole crew loses in a day for every lane at once, from a normal with the
+    crew's mean and variance. The crew's total is a sum over independent people, so it is close
+    to normal (central limit theorem). The water lost is never negative.
+    """
+    return np.maximum(rng.normal(mean, np.sqrt(variance)), 0)
+
+
+def simulate_batch(water_mined_per_day: float, num_trials: int, rng: "np.random.Generator | None" = None,
+                   scenario: Scenario = DEFAULT_SCENARIO, aggregate: bool = False,
+                   antithetic: bool = False) -> 'tuple[np.ndarray, np.ndarray, np.ndarray]':
+    """
+    Runs num_trials colonies at once, with every trial stored as one lane of a numpy array.
+
+    The model is the same as simulate(): the ration branches and failures are handled with
+    per-lane masks instead of if statements, so every lane advances one day per step.
+    Returns arrays of (success, water_stored, days_survived) with one entry per trial.
+
+    This takes about 1.1 ms per lane on one core, so 10k trials take about 11 s and 100k about
+    2 minutes per core. That is about 8x faster than the kernel without Numba, but about 3x
+    slower than the compiled one, see DEFAULT_ENGINE.
+
+    With aggregate, each lane's daily water lost is drawn directly from a normal with the same
+    mean and variance as the sum over the crew's schedule classes (see get_water_lost_moments()),
+    instead of drawing every person's deviations. A day then costs the same for any number of
+    people, at the price of approximating the uniform per-person deviations, which only matters
+    for very small crews.
+
+    With antithetic, the draws of the second half of the lanes mirror those of the first half
+    (see AntitheticGenerator).
+    Every day makes the same draws whatever state the lanes are in, so lane k sees the same
+    draws for any mining rate given the same rng.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if antithetic:
+        rng = AntitheticGenerator(rng)
+
+    start_water = scenario.start_water
+    water_ration_threshold = scenario.water_ration_threshold
+    recycle_percentage = scenario.recycle_percentage
+    min_recycle_percentage = recycle_percentage - 0.05
+
+    water_stored = np.full(num_trials, start_water)
+    days_survived = np.zeros(num_trials, dtype=np.int64)
+    failed = np.zeros(num_trials, dtype=bool)
+
+    people = np.arange(scenario.num_people)
+
+    if aggregate:
+        # ISS Astronauts use 3 gal per day
+        flight_mean, flight_variance = get_water_lost_moments(np.array([3.0]), min_recycle_percentage)
+        # Water lost per person in each ration tier and schedule class
+        class_means, class_variances = get_water_lost_moments(
+            TIER_ACTIVITY_WATER[:, None, :] * SCHEDULE_ACTIVITIES, min_recycle_percentage)
 
     # During Flight
-    for day in range(1, FLIGHT_DAYS + 1):
-        failed = water_stored <= 0
-        if failed:
+    for day in range(1, scenario.flight_days + 1):
+        failed |= water_stored <= 0
+        alive = ~failed
+        if not alive.any():
             break
 
-        days_survived += 1
-        water_used_today = 0
-        water_lost_today = 0
-        water_recycled_today = 0
-
-        for x in range(NUM_PEOPLE):
-            individual_water, individual_recycled = get_individual_space_water_usage()
-            water_used_today += individual_water
-            water_recycled_today += individual_recycled
+        days_survived += alive
 
-        water_lost_today = water_used_today - water_recycled_today
+        if aggregate:
+            water_lost_today = get_aggregate_water_lost(rng, np.full(num_trials, scenario.num_people * flight_mean),
+                                                        scenario.num_people * flight_variance)
+        else:
+            # ISS Astronauts use 3 gal per day
+            individual_water = 3 * (1 + get_uniform_batch(rng, (scenario.num_people, num_trials)) * 0.2 - 0.1)
+            individual_recycled = individual_water * (recycle_percentage + get_uniform_batch(rng, (scenario.num_people, num_trials)) * 0.1 - 0.05)
+            water_lost_today = (individual_water - individual_recycled).sum(axis=0)
 
-        total_water_used += water_used_today
-        total_water_lost += water_lost_today
-        total_water_recycled += water_recycled_today
+        water_stored = np.where(alive, np.maximum(water_stored - water_lost_today, 0), water_stored)
 
-        water_stored -= water_lost_today
-        water_stored = max(water_stored, 0)
-
-    colonization_water_used = 0.0
-    colonization_water_lost = 0.0
-    colonization_water_gained = 0.0
-    colonization_water_recycled = 0.0
-
-    days_failing = 0
-    fail_percent = 0
-    mining_efficiency = 1
+    days_failing = np.zeros(num_trials, dtype=np.int64)
+    fail_percent = np.zeros(num_trials)
+    mining_efficiency = np.ones(num_trials)
 
     # During Colonization
-    for day in range(1, COLONY_DAYS + 1):
-        if failed:
+    for day in range(1, scenario.colony_days + 1):
+        alive = ~failed
+        if not alive.any():
             break
-        
-        days_survived += 1
-        failed = water_stored <= 0
-        water_used_today = 0
-        water_lost_today = 0
-        water_recycled_today = 0
-
-        for x in range(NUM_PEOPLE):
-            # Colonists split up water rations over a schedule 
-            cycle = x + day
-            if water_stored < WATER_RATION_THRESHOLD:
-                # 2.5 gal hygiene
-                # 1 gal drinking
-                individual_water = get_individual_water_usage(3.5)
-                if cycle % 3 == 0:
-                    # shower (20 gal) (every 3 days)
-                    individual_water += get_individual_water_usage(20)
-                if cycle % 4 == 0:
-                    # Washing machine (15 gal) (every 4 days)
-                    individual_water += get_individual_water_usage(15)
-                if cycle % 2 == 0:
-                    # Dishwasher (5 gal) (every 2 days)
-                    individual_water += get_individual_water_usage(5)
-            elif water_stored < START_WATER:
-                # if there is nearly no water, cut water usage to only basic needs
-                individual_water = get_individual_water_usage(3.5)
-            else:
-                # 5 gal dishwasher
-                # 20 gal shower
-                # space toilet = no water
-                # 2.5 gal hygiene
-                # 1 gal drinking
-                individual_water = get_individual_water_usage(5 + 20 + 2.5 + 1)
-                if cycle % 4 == 0:
-                    # Washing machine (15 gal) (every 4 days)
-                    individual_water += get_individual_water_usage(15)
-            water_used_today += individual_water
-            water_recycled_today += individual_water * get_recycle_percentage()
-
-        if day > DAYS_UNTIL_FARMING:
-            water_used_today += FARMING_WATER_USED
-
-        water_lost_today = water_used_today - water_recycled_today
+
+        days_survived += alive
+        failed |= alive & (water_stored <= 0)
+
+        # Ration tier of every lane, decided by the water stored at the start of the day
+        rationing = water_stored < water_ration_threshold
+        basic_only = ~rationing & (water_stored < start_water)
+
+        if aggregate:
+            # Only the number of people in each schedule class matters
+            class_sizes = get_schedule_class_sizes(scenario.num_people, day)
+            tiers = np.where(rationing, 0, np.where(basic_only, 1, 2))
+            water_lost_today = get_aggregate_water_lost(rng, (class_means @ class_sizes)[tiers],
+                                                        (class_variances @ class_sizes)[tiers])
+            if day > scenario.days_until_farming:
+                water_lost_today += scenario.farming_water_used
+        else:
+            # Colonists split up water rations over a schedule, which only depends on the day,
+            # so every lane shares the same columns: base usage for everyone, then the people
+            # that shower, do laundry and run the dishwasher today
+            cycle = people + day
+            columns = np.concatenate((people, people[cycle % 3 == 0], people[cycle % 4 == 0], people[cycle % 2 == 0]))
+            groups = np.repeat(np.arange(4), [scenario.num_people, (cycle % 3 == 0).sum(), (cycle % 4 == 0).sum(), (cycle % 2 == 0).sum()])
+            group_matrix = np.zeros((4, len(columns)), dtype=np.float32)
+            group_matrix[groups, np.arange(len(columns))] = 1
+            group_sizes = group_matrix.sum(axis=1)[:, None]
+            person_matrix = np.zeros((4, scenario.num_people), dtype=np.float32)
+            np.add.at(person_matrix, (groups, columns), 1)
+
+            # Gallons per group and lane:
+            # 2.5 gal hygiene + 1 gal drinking when rationing, otherwise
+            # 5 gal dishwasher + 20 gal shower + 2.5 gal hygiene + 1 gal drinking.
+            # Shower (20 gal) every 3 days and dishwasher (5 gal) every 2 days when rationing,
+            # washing machine (15 gal) every 4 days unless there is nearly no water
+            group_water = np.stack((
+                np.where(rationing | basic_only, 3.5, 5 + 20 + 2.5 + 1),
+                20 * rationing,
+                15 * ~basic_only,
+                5 * rationing,
+            ))
+
+            # The same draws are made every day no matter which branch a lane is in.
+            # With u, v uniform on [0, 1), each activity uses (0.9 + 0.2u) times its base water
+            # and each person recycles (r + 0.1v) of it, with r = recycle_percentage - 0.05, so only
+            # the sums of u, v and u*v per group are needed. Lanes are the last axis so that picking
+            # columns copies whole rows
+            u = get_uniform_batch(rng, (len(columns), num_trials))
+            v = get_uniform_batch(rng, (scenario.num_people, num_trials))
+            sum_u = group_matrix @ u
+            sum_v = person_matrix @ v
+            sum_uv = group_matrix @ (u * v[columns])
+
+            deviation_sums = 0.9 * group_sizes + 0.2 * sum_u
+            recycled_sums = (0.9 * min_recycle_percentage * group_sizes + 0.2 * min_recycle_percentage * sum_u
+                             + 0.09 * sum_v + 0.02 * sum_uv)
+
+            water_used_today = (group_water * deviation_sums).sum(axis=0)
+            water_recycled_today = (group_water * recycled_sums).sum(axis=0)
+
+            if day > scenario.days_until_farming:
+                water_used_today += scenario.farming_water_used
+
+            water_lost_today = water_used_today - water_recycled_today
 
         # Mining productivity goes up 5% at a time for the first 30 days
-        setup_factor = round(min(1, day / MINING_SETUP_PERIOD) * 20) / 20
+        setup_factor = round(min(1, day / scenario.mining_setup_period) * 20) / 20
 
         # 20% deviation in mining + setup factor
-        water_mined_today = water_mined_per_day * (1 + random.random() * 0.4 - 0.2) * setup_factor * mining_efficiency
+        water_mined_today = water_mined_per_day * (1 + rng.random(num_trials) * 0.4 - 0.2) * setup_factor * mining_efficiency
 
-        # Mining efficiency will vary by up to +-5%
-        mining_efficiency += (random.random() * 0.1 - 0.05)
-        # Mining efficiency goes from 20 - 100%
-        mining_efficiency = max(min(1, mining_efficiency), 0.2)
+        # Mining efficiency will vary by up to +-5% and goes from 20 - 100%
+        mining_efficiency = np.clip(mining_efficiency + rng.random(num_trials) * 0.1 - 0.05, 0.2, 1)
 
         # A machine can fail for up to 5 days
-        if (random.random() < MINING_FAIL_CHANCE):
-            days_failing = random.randint(1, 5)
-            fail_percent = random.random()
-
-        if (days_failing > 0):
-            water_mined_today *= fail_percent
-            days_failing -= 1
-
-        water_gained_today = water_mined_today
-
-        colonization_water_lost += water_lost_today
-        colonization_water_used += water_used_today
-        colonization_water_recycled += water_recycled_today
-        colonization_water_gained += water_gained_today
-        
-        total_water_lost += water_lost_today
-        total_water_used += water_used_today
-        total_water_recycled += water_recycled_today
-        total_water_gained += water_gained_today
-
-        water_stored += water_gained_today - water_lost_today
+        machine_failed = rng.random(num_trials) < scenario.mining_fail_chance
+        new_days_failing = rng.integers(1, 6, num_trials)
+        new_fail_percent = rng.random(num_trials)
+        days_failing = np.where(machine_failed, new_days_failing, days_failing)
+        fail_percent = np.where(machine_failed, new_fail_percent, fail_percent)
+
+        mining_failing = days_failing > 0
+        water_mined_today = np.where(mining_failing, water_mined_today * fail_percent, water_mined_today)
+        days_failing = np.where(mining_failing & alive, days_failing - 1, days_failing)
+
         # Stop water stored from exceeding max
-        water_stored = min(water_stored, MAX_WATER_STORED)
-        water_stored = max(water_stored, 0)
-    
-    return (not failed, water_stored, days_survived)
+        new_water_stored = np.clip(water_stored + water_mined_today - water_lost_today, 0, scenario.max_water_stored)
+        water_stored = np.where(alive, new_water_stored, water_stored)
+
+    return (~failed, water_stored, days_survived)
 
 NUM_TRIALS = 100
 
-success_rate_dict = {}
-water_left_dict = {}
-days_survived_dict = {}
-
-for daily_water_mined in range(50, 425, 25):
-    successes = []
-    water_left_list = []
-    days_survived_list = []
-    for _ in range(NUM_TRIALS):
-        success, water_left, days_survived = simulate(daily_water_mined)
-        successes.append(success)
-        water_left_list.append(water_left)
-        days_survived_list.append(days_survived)
-    
-    success_rate_dict[daily_water_mined] = 100 * successes.count(True) / len(successes)
-    water_left_dict[daily_water_mined] = sum(water_left_list) / len(water_left_list)
-    days_survived_dict[daily_water_mined] = sum(days_survived_list) / len(days_survived_list)
-
-# with open("output.csv", "w") as f:
-#     f.write("Daily Mining Rate (gal/day), Survival Rate, Average Water Left (gal), Average Days Survived\n")
-#     for mining_rate in success_rate_dict.keys():
-#         f.write(f"{mining_rate},{success_rate_dict[mining_rate]},{water_left_dict[mining_rate]},{days_survived_dict[mining_rate]}\n")
-
-mining_rates = []
-success_rates = []
-water_left = []
-days_survived = []
-
-for mining_rate in success_rate_dict.keys():
-    mining_rates.append(mining_rate)
-    success_rates.append(success_rate_dict[mining_rate])
-    water_left.append(water_left_dict[mining_rate])
-    days_survived.append(days_survived_dict[mining_rate])
-
-
-fig, axs = plt.subplots(3, 1, sharex=True)
-fig.set_size_inches(12, 8)
-fig.suptitle("Water Usage on Mars")
-fig.supxlabel("Daily water mining capacity (gal)")
-fig.subplots_adjust(hspace=0.12)
-
-success_plot = axs[0].plot(mining_rates, success_rates, c="limegreen", lw=3)
-axs[0].set_ylim(0, 110)
-axs[0].set_ylabel("Colony survival rate")
-
-max_survival = axs[0].plot(mining_rates, [
-                        100 for rate in mining_rates], linestyle="--", color="lawngreen")
-
-
-water_plot = axs[1].plot(mining_rates, water_left, c="blue", lw=3)
-axs[1].set_ylim(0, max(water_left) + 10000)
-axs[1].set_ylabel("Average water left (gal)")
-
-max_water = axs[1].plot(mining_rates, [MAX_WATER_STORED for rate in mining_rates], linestyle="--", color="cornflowerblue")
-
-survival_plot = axs[2].bar(mining_rates, days_survived, width=20, color="cadetblue")
-axs[2].set_ylabel("Average Days Survived")
-# success_plot.
-
-plt.show()
\ No newline at end of file
+MINING_RATES = range(50, 425, 25)
+
+# Trials given to one worker at a time
+TRIALS_PER_CHUNK = 2000
+# Smaller chunks let adaptive_sweep() stop closer to the target interval width
+ADAPTIVE_TRIALS_PER_CHUNK = 250
+
+# Bump whenever a change to the model or to the format of the results changes them, so cached
+# results aren't reused
+MODEL_VERSION = 6
+
+# Engine used unless another is given. The compiled serial kernel takes about 0.3 ms per trial
+# on one core, against about 1.1 ms per lane for simulate_batch(), which is only faster when the
+# kernel isn't compiled (about 9 ms per trial)
+DEFAULT_ENGINE = "serial" if COMPILED else "batch"
+
+# Seed used when running this script, fixed so that re-running it reuses cached results.
+# Change it to run a new set of trials
+SEED = 2023
+
+
+def get_rate_key(water_mined_per_day: float) -> int:
+    """
+    Mining rate in thousandths of a gallon per day, used to key its random streams
+    """
+    return round(water_mined_per_day * 1000)
+
+
+def get_stream_key(water_mined_per_day: float, sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[int, ...]':
+    """
+    Key of the random streams of a mining rate, which every trial or chunk number is added to.
+    With common random numbers, every rate shares the same streams.
+    """
+    if sampling.common_random_numbers:
+        return ()
+    return (get_rate_key(water_mined_per_day),)
+
+
+def run_work_unit(water_mined_per_day: float, chunk: int, first_trial: int, num_trials: int,
+                  seed: int, engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+                  sampling: Sampling = DEFAULT_SAMPLING) -> TrialStats:
+    """
+    Runs one (mining rate, chunk of trials) work unit in a worker process.
+
+    The "serial" engine runs simulate() once per trial with the stream for (mining rate, trial),
+    so it matches running those trials one by one. The "batch" engine runs the chunk through
+    simulate_batch() with the stream for (mining rate, chunk), and the "aggregate" engine does the
+    same with aggregate=True, so its cost doesn't grow with the number of people.
+
+    With common random numbers the streams are keyed by the trial (or chunk) only, so trial (or
+    lane) k gets the same draws at every rate with any engine, as every engine makes the same
+    draws every day whatever state a colony is in.
+    Returns the TrialStats of the chunk instead of per-trial arrays, so that little data goes
+    back to the main process whatever the chunk size.
+    """
+    stream_key = get_stream_key(water_mined_per_day, sampling)
+    stats = TrialStats(scenario)
+
+    if engine == "serial":
+        if sampling.antithetic:
+            raise ValueError("Antithetic sampling needs the batch or aggregate engine")
+        for trial in range(first_trial, first_trial + num_trials):
+            stats.add(*simulate(water_mined_per_day, make_trial_rng(seed, *stream_key, trial), scenario))
+    elif engine in ("batch", "aggregate"):
+        rng = np.random.default_rng(get_seed_sequence(seed, *stream_key, chunk))
+        stats.add(*simulate_batch(water_mined_per_day, num_trials, rng, scenario,
+                                  aggregate=engine == "aggregate", antithetic=sampling.antithetic))
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    return stats
+
+
+def get_work_units(mining_rates, num_trials: int, trials_per_chunk: int) -> 'list[tuple[float, int, int, int]]':
+    """
+    Splits a sweep into (mining rate, chunk, first trial, number of trials) work units
+    """
+    work_units = []
+    for water_mined_per_day in mining_rates:
+        for chunk, first_trial in enumerate(range(0, num_trials, trials_per_chunk)):
+            work_units.append((water_mined_per_day, chunk, first_trial, min(trials_per_chunk, num_trials - first_trial)))
+    return work_units
+
+
+def get_work_unit_key(work_unit: 'tuple[float, int, int, int]', seed: int, engine: str, scenario: Scenario,
+                      sampling: Sampling = DEFAULT_SAMPLING) -> str:
+    """
+    Content hash identifying the result of a work unit in a ResultCache
+    """
+    water_mined_per_day, chunk, first_trial, num_trials = work_unit
+    return ResultCache.make_key(MODEL_VERSION, asdict(scenario), float(water_mined_per_day), chunk,
+                                first_trial, num_trials, seed, engine, asdict(sampling))
+
+
+def submit_work_units(executor: ProcessPoolExecutor, work_units: list, seed: int, engine: str = DEFAULT_ENGINE,
+                      scenario: Scenario = DEFAULT_SCENARIO, cache: "ResultCache | None" = None,
+                      sampling: Sampling = DEFAULT_SAMPLING) -> 'list[tuple]':
+    """
+    Starts running work units on the executor without waiting for them. With a cache, the work
+    units it already holds aren't run. Returns a (cached TrialStats or future, cache key) pair per
+    work unit, for collect_work_units().
+    """
+    submitted = []
+    for work_unit in work_units:
+        key = None
+        if cache is not None:
+            key = get_work_unit_key(work_unit, seed, engine, scenario, sampling)
+            state = cache.get(key)
+            if state is not None:
+                submitted.append((TrialStats.from_state(state), None))
+                continue
+        submitted.append((executor.submit(run_work_unit, *work_unit, seed, engine, scenario, sampling), key))
+    return submitted
+
+
+def collect_work_units(submitted: 'list[tuple]', cache: "ResultCache | None" = None) -> 'list[TrialStats]':
+    """
+    Waits for the work units started by submit_work_units() and returns their results in the same
+    order. The results that were run are added to the cache.
+    """
+    results = []
+    for result, key in submitted:
+        if isinstance(result, Future):
+            result = result.result()
+            if key is not None:
+                cache.put(key, result.to_state())
+        results.append(result)
+    return results
+
+
+def run_work_units(executor: ProcessPoolExecutor, work_units: list, seed: int, engine: str = DEFAULT_ENGINE,
+                   scenario: Scenario = DEFAULT_SCENARIO, cache: "ResultCache | None" = None,
+                   sampling: Sampling = DEFAULT_SAMPLING) -> 'list[TrialStats]':
+    """
+    Runs work units on the executor and returns their results in the same order.
+    With a cache, only the work units it doesn't already hold are run, and their results are added.
+    """
+    return collect_work_units(submit_work_units(executor, work_units, seed, engine, scenario, cache, sampling), cache)
+
+
+def sweep_stats(mining_rates=MINING_RATES, num_trials: int = NUM_TRIALS, seed: "int | None" = None,
+                max_workers: "int | None" = None, trials_per_chunk: int = TRIALS_PER_CHUNK,
+                engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+                cache: "ResultCache | None" = None,
+                sampling: Sampling = DEFAULT_SAMPLING) -> 'dict[float, TrialStats]':
+    """
+    Runs num_trials colonies for every mining rate across a pool of worker processes.
+
+    Every mining rate is split into chunks of at most trials_per_chunk trials. Random streams are
+    keyed by the mining rate and the trial (or chunk) under seed, so the results only depend on
+    the seed, the engine and the chunk size, not on the number of workers or the other rates in
+    the sweep, and any trial can be re-run with replay_trial(). If no seed is given a fresh one
+    is drawn. With a cache, chunks computed by earlier seeded sweeps are reused.
+
+    Pass Sampling(common_random_numbers=True) to run trial k of every rate on the same stream,
+    which makes the survival curve much smoother for the same number of trials, and
+    antithetic=True to also pair up mirrored trials (see Sampling).
+    Returns the merged TrialStats of every mining rate, see sweep() for just the means and
+    get_band_dicts() for percentile bands.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    work_units = get_work_units(mining_rates, num_trials, trials_per_chunk)
+
+    totals = {water_mined_per_day: TrialStats(scenario) for water_mined_per_day in mining_rates}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = run_work_units(executor, work_units, seed, engine, scenario, cache, sampling)
+
+    # Merge in work unit order so floating point sums don't depend on scheduling
+    for work_unit, result in zip(work_units, results):
+        totals[work_unit[0]].merge(result)
+
+    return totals
+
+
+def sweep(mining_rates=MINING_RATES, num_trials: int = NUM_TRIALS, seed: "int | None" = None,
+          max_workers: "int | None" = None, trials_per_chunk: int = TRIALS_PER_CHUNK,
+          engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+          cache: "ResultCache | None" = None,
+          sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[dict, dict, dict]':
+    """
+    Runs sweep_stats() and returns (success_rate_dict, water_left_dict, days_survived_dict)
+    keyed by mining rate, with the mean water left and days survived.
+    """
+    return get_sweep_dicts(sweep_stats(mining_rates, num_trials, seed, max_workers, trials_per_chunk,
+                                       engine, scenario, cache, sampling))
+
+
+def scenario_sweep(mining_rates=MINING_RATES, num_trials: int = NUM_TRIALS, base: Scenario = DEFAULT_SCENARIO,
+                   seed: "int | None" = None, max_workers: "int | None" = None,
+                   trials_per_chunk: int = TRIALS_PER_CHUNK, engine: str = DEFAULT_ENGINE,
+                   cache: "ResultCache | None" = None, sampling: Sampling = DEFAULT_SAMPLING,
+                   **fields) -> 'dict[Scenario, tuple[dict, dict, dict]]':
+    """
+    Runs sweep() for every combination of the given scenario fields in one process pool, e.g.
+    scenario_sweep(num_people=[10, 20, 40], recycle_percentage=[0.8, 0.85, 0.9]).
+    Fields that aren't given keep their value from base.
+
+    Every scenario uses the same random streams, so differences between scenarios aren't hidden
+    by different draws, and the base scenario gives the same results as sweep().
+    The work units of later scenarios are queued while earlier ones are collected, so the pool
+    doesn't drain between scenarios, however small each one is.
+    Returns a dictionary from each Scenario to its (success_rate_dict, water_left_dict,
+    days_survived_dict).
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    scenarios = [replace(base, **dict(zip(fields, values))) for values in itertools.product(*fields.values())]
+    work_units = get_work_units(mining_rates, num_trials, trials_per_chunk)
+
+    scenario_dicts = {}
+    # Work units queued behind the oldest scenario's, enough to keep every worker busy while its
+    # results are merged, but few enough that finished results don't pile up
+    queued_work_units = 2 * (max_workers or os.cpu_count() or 1)
+    pending = deque()
+
+    def collect_oldest() -> None:
+        scenario, submitted = pending.popleft()
+        totals = {water_mined_per_day: TrialStats(scenario) for water_mined_per_day in mining_rates}
+        for work_unit, result in zip(work_units, collect_work_units(submitted, cache)):
+            totals[work_unit[0]].merge(result)
+        scenario_dicts[scenario] = get_sweep_dicts(totals)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for scenario in scenarios:
+            pending.append((scenario, submit_work_units(executor, work_units, seed, engine, scenario, cache, sampling)))
+            while (len(pending) - 1) * len(work_units) >= queued_work_units:
+                collect_oldest()
+        while pending:
+            collect_oldest()
+
+    return scenario_dicts
+
+
+def get_sweep_dicts(totals: 'dict[float, TrialStats]') -> 'tuple[dict, dict, dict]':
+    """
+    Turns the TrialStats of every mining rate into (success_rate_dict, water_left_dict,
+    days_survived_dict)
+    """
+    success_rate_dict = {}
+    water_left_dict = {}
+    days_survived_dict = {}
+
+    for water_mined_per_day, stats in totals.items():
+        success_rate_dict[water_mined_per_day] = stats.success_rate
+        water_left_dict[water_mined_per_day] = stats.water_left.mean
+        days_survived_dict[water_mined_per_day] = stats.days_survived.mean
+
+    return (success_rate_dict, water_left_dict, days_survived_dict)
+
+
+def get_band_dicts(totals: 'dict[float, TrialStats]', percentiles=BAND_PERCENTILES) -> 'tuple[dict, dict]':
+    """
+    Turns the TrialStats of every mining rate into (water_left_band_dict, days_survived_band_dict),
+    which hold an array of the given percentiles for every mining rate
+    """
+    water_left_band_dict = {}
+    days_survived_band_dict = {}
+
+    for water_mined_per_day, stats in totals.items():
+        water_left_band_dict[water_mined_per_day], days_survived_band_dict[water_mined_per_day] = (
+            stats.get_percentiles(percentiles))
+
+    return (water_left_band_dict, days_survived_band_dict)
+
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> 'tuple[float, float]':
+    """
+    Wilson score interval for a survival rate, in percent.
+    Unlike the normal approximation it stays inside 0-100% and doesn't collapse to zero width
+    when every trial survives or every trial fails.
+    """
+    if trials == 0:
+        return (0.0, 100.0)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = successes / trials
+    center = (rate + z**2 / (2 * trials)) / (1 + z**2 / trials)
+    half_width = z / (1 + z**2 / trials) * math.sqrt(rate * (1 - rate) / trials + z**2 / (4 * trials**2))
+    return (100 * max(center - half_width, 0), 100 * min(center + half_width, 1))
+
+
+def adaptive_sweep(mining_rates=MINING_RATES, ci_width: float = 5, confidence: float = 0.95,
+                   max_trials: int = 10 * TRIALS_PER_CHUNK, seed: "int | None" = None,
+                   max_workers: "int | None" = None, trials_per_chunk: int = ADAPTIVE_TRIALS_PER_CHUNK,
+                   engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+                   cache: "ResultCache | None" = None,
+                   sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[dict, dict, dict, dict, dict]':
+    """
+    Like sweep(), but keeps adding chunks of trials to each mining rate until the confidence
+    interval of its survival rate is narrower than ci_width percentage points, or it has run
+    max_trials trials. Rates that always fail or always survive stop after a few chunks, so most
+    trials go to the rates near the transition.
+
+    Chunks use the same random streams as sweep() with the same seed and chunk size, so an
+    adaptive sweep runs a prefix of the trials of the equivalent fixed sweep.
+    Returns (success_rate_dict, water_left_dict, days_survived_dict, ci_dict, trials_dict), where
+    ci_dict holds the (low, high) survival rate interval in percent.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    totals = {water_mined_per_day: TrialStats(scenario) for water_mined_per_day in mining_rates}
+    ci_dict = {water_mined_per_day: (0.0, 100.0) for water_mined_per_day in mining_rates}
+    chunks = {water_mined_per_day: 0 for water_mined_per_day in mining_rates}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            work_units = []
+            for water_mined_per_day, stats in totals.items():
+                trials = stats.trials
+                low, high = ci_dict[water_mined_per_day]
+                if trials >= max_trials or (trials > 0 and high - low < ci_width):
+                    continue
+                chunk = chunks[water_mined_per_day]
+                chunks[water_mined_per_day] += 1
+                work_units.append((water_mined_per_day, chunk, chunk * trials_per_chunk,
+                                   min(trials_per_chunk, max_trials - trials)))
+
+            if not work_units:
+                break
+
+            for work_unit, result in zip(work_units, run_work_units(executor, work_units, seed, engine, scenario,
+                                                                    cache, sampling)):
+                totals[work_unit[0]].merge(result)
+
+            for water_mined_per_day, stats in totals.items():
+                ci_dict[water_mined_per_day] = wilson_interval(stats.successes, stats.trials, confidence)
+
+    trials_dict = {water_mined_per_day: stats.trials for water_mined_per_day, stats in totals.items()}
+    return (*get_sweep_dicts(totals), ci_dict, trials_dict)
+
+
+def estimate_survival(executor: ProcessPoolExecutor, water_mined_per_day: float, target_survival: float,
+                      confidence: float, max_trials: int, trials_per_chunk: int, max_chunks_per_round: int,
+                      seed: int, engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+                      cache: "ResultCache | None" = None,
+                      sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[TrialStats, tuple[float, float]]':
+    """
+    Runs chunks of trials at one mining rate until the confidence interval of its survival rate is
+    entirely above or below target_survival, or max_trials trials have run.
+
+    The first round is a single chunk, and every round after that twice as many, up to
+    max_chunks_per_round, so rates far from the target stop after one chunk while the pool is
+    still kept busy near it. Returns the TrialStats and the (low, high) interval in percent.
+    """
+    total = TrialStats(scenario)
+    ci = (0.0, 100.0)
+    chunk = 0
+    chunks_per_round = 1
+    while total.trials < max_trials and ci[0] <= target_survival <= ci[1]:
+        work_units = []
+        for _ in range(chunks_per_round):
+            trials = min(trials_per_chunk, max_trials - chunk * trials_per_chunk)
+            if trials <= 0:
+                break
+            work_units.append((water_mined_per_day, chunk, chunk * trials_per_chunk, trials))
+            chunk += 1
+        for result in run_work_units(executor, work_units, seed, engine, scenario, cache, sampling):
+            total.merge(result)
+        ci = wilson_interval(total.successes, total.trials, confidence)
+        chunks_per_round = min(2 * chunks_per_round, max_chunks_per_round)
+
+    return (total, ci)
+
+
+def find_min_safe_capacity(target_survival: float = 99, low: float = MINING_RATES[0], high: float = MINING_RATES[-1],
+                           tolerance: float = 1, confidence: float = 0.95, max_trials_per_step: int = 20000,
+                           seed: "int | None" = None, max_workers: "int | None" = None,
+                           trials_per_chunk: int = ADAPTIVE_TRIALS_PER_CHUNK, engine: str = DEFAULT_ENGINE,
+                           scenario: Scenario = DEFAULT_SCENARIO, cache: "ResultCache | None" = None,
+                           sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[float, list]':
+    """
+    Finds the smallest daily mining capacity (gal) whose survival rate is at least target_survival
+    percent, by bisection between low (assumed unsafe) and high, which is checked to be safe first.
+    Raises ValueError if it isn't.
+
+    Each step runs chunks of trials at the midpoint only until the confidence interval of its
+    survival rate is entirely above or below the target (see estimate_survival()), so steps far
+    from the answer are cheap. If max_trials_per_step is reached first, the point estimate decides.
+    With common random numbers every midpoint runs the same trials, so the survival rate can't
+    rise or fall between steps from noise alone.
+    Returns (capacity, steps), where capacity is the upper end of the final bracket and steps lists
+    (mining rate, survival rate, (low, high) interval, trials) for high and every evaluated midpoint.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    max_chunks_per_round = max_workers or os.cpu_count() or 1
+    steps = []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        water_mined_per_day = high
+        while True:
+            total, ci = estimate_survival(executor, water_mined_per_day, target_survival, confidence,
+                                          max_trials_per_step, trials_per_chunk, max_chunks_per_round,
+                                          seed, engine, scenario, cache, sampling)
+            survival_rate = total.success_rate
+            steps.append((water_mined_per_day, survival_rate, ci, total.trials))
+
+            if survival_rate >= target_survival:
+                high = water_mined_per_day
+            elif len(steps) == 1:
+                raise ValueError(f"The upper bound of {high} gal/day only has a {survival_rate:.2f}% survival rate, "
+                                 f"below the target of {target_survival}%")
+            else:
+                low = water_mined_per_day
+
+            if high - low <= tolerance:
+                break
+            water_mined_per_day = (low + high) / 2
+
+    return (high, steps)
+
+
+def replay_trial(water_mined_per_day: float, trial: int, seed: int,
+                 num_trials: int = NUM_TRIALS, trials_per_chunk: int = TRIALS_PER_CHUNK,
+                 engine: str = DEFAULT_ENGINE, scenario: Scenario = DEFAULT_SCENARIO,
+                 sampling: Sampling = DEFAULT_SAMPLING) -> 'tuple[bool, float, int]':
+    """
+    Re-runs a single trial of a seeded sweep() bit-for-bit. engine must be the one the sweep ran
+    with, which by default depends on whether Numba is installed (see DEFAULT_ENGINE).
+
+    The serial engine only needs the trial's own stream. The batch and aggregate engines share one
+    stream between the lanes of a chunk, so the trial's whole chunk is re-run and its lane is returned.
+    """
+    stream_key = get_stream_key(water_mined_per_day, sampling)
+
+    if engine == "serial":
+        if sampling.antithetic:
+            raise ValueError("Antithetic sampling needs the batch or aggregate engine")
+        return simulate(water_mined_per_day, make_trial_rng(seed, *stream_key, trial), scenario)
+
+    first_trial = trial - trial % trials_per_chunk
+    chunk_trials = min(trials_per_chunk, num_trials - first_trial)
+    rng = np.random.default_rng(get_seed_sequence(seed, *stream_key, first_trial // trials_per_chunk))
+    successes, water_left, days_survived = simulate_batch(water_mined_per_day, chunk_trials, rng, scenario,
+                                                          aggregate=engine == "aggregate",
+                                                          antithetic=sampling.antithetic)
+    lane = trial - first_trial
+    return (bool(successes[lane]), float(water_left[lane]), int(days_survived[lane]))
+
+
+def plot_sweep(success_rate_dict: dict, water_left_dict: dict, days_survived_dict: dict,
+               scenario: Scenario = DEFAULT_SCENARIO, band_dicts: "tuple[dict, dict] | None" = None) -> None:
+    """
+    Plots the survival rate, average water left and average days survived for every mining rate.
+    With band_dicts from get_band_dicts(), the percentile bands of the water left and days
+    survived are shaded around them, the outermost pair of percentiles lightest.
+    """
+    # with open("output.csv", "w") as f:
+    #     f.write("Daily Mining Rate (gal/day), Survival Rate, Average Water Left (gal), Average Days Survived\n")
+    #     for mining_rate in success_rate_dict.keys():
+    #         f.write(f"{mining_rate},{success_rate_dict[mining_rate]},{water_left_dict[mining_rate]},{days_survived_dict[mining_rate]}\n")
+
+    # Imported here so that importing this module (for example in a worker process) doesn't load matplotlib
+    import matplotlib.pyplot as plt
+
+    mining_rates = []
+    success_rates = []
+    water_left = []
+    days_survived = []
+
+    for mining_rate in success_rate_dict.keys():
+        mining_rates.append(mining_rate)
+        success_rates.append(success_rate_dict[mining_rate])
+        water_left.append(water_left_dict[mining_rate])
+        days_survived.append(days_survived_dict[mining_rate])
+
+
+    fig, axs = plt.subplots(3, 1, sharex=True)
+    fig.set_size_inches(12, 8)
+    fig.suptitle("Water Usage on Mars")
+    fig.supxlabel("Daily water mining capacity (gal)")
+    fig.subplots_adjust(hspace=0.12)
+
+    success_plot = axs[0].plot(mining_rates, success_rates, c="limegreen", lw=3)
+    axs[0].set_ylim(0, 110)
+    axs[0].set_ylabel("Colony survival rate")
+
+    max_survival = axs[0].plot(mining_rates, [
+                            100 for rate in mining_rates], linestyle="--", color="lawngreen")
+
+
+    water_plot = axs[1].plot(mining_rates, water_left, c="blue", lw=3)
+    axs[1].set_ylim(0, max(water_left) + 10000)
+    axs[1].set_ylabel("Average water left (gal)")
+
+    max_water = axs[1].plot(mining_rates, [scenario.max_water_stored for rate in mining_rates], linestyle="--", color="cornflowerblue")
+
+    survival_plot = axs[2].bar(mining_rates, days_survived, width=20, color="cadetblue")
+    axs[2].set_ylabel("Average Days Survived")
+
+    if band_dicts is not None:
+        water_left_bands = np.array([band_dicts[0][mining_rate] for mining_rate in mining_rates])
+        days_survived_bands = np.array([band_dicts[1][mining_rate] for mining_rate in mining_rates])
+        pairs = water_left_bands.shape[1] // 2
+        for pair in range(pairs):
+            alpha = 0.15 * (pair + 1)
+            axs[1].fill_between(mining_rates, water_left_bands[:, pair], water_left_bands[:, -1 - pair],
+                                color="blue", alpha=alpha, lw=0)
+            axs[2].fill_between(mining_rates, days_survived_bands[:, pair], days_survived_bands[:, -1 - pair],
+                                color="darkslategray", alpha=alpha, lw=0)
+        axs[1].set_ylim(0, max(water_left_bands.max(), max(water_left)) + 10000)
+    # success_plot.
+
+    plt.show()
+
+
+def main() -> None:
+    totals = sweep_stats(seed=SEED, cache=ResultCache())
+    success_rate_dict, water_left_dict, days_survived_dict = get_sweep_dicts(totals)
+    plot_sweep(success_rate_dict, water_left_dict, days_survived_dict, band_dicts=get_band_dicts(totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Default location of the sweep result cache, relative to the working directory
+CACHE_PATH = "sweep_cache.sqlite"
+
+# Most results kept before the least recently used ones are evicted
+MAX_ENTRIES = 1_000_000
+
+# Seconds to wait for another process holding a write lock on the cache
+LOCK_TIMEOUT = 60
+
+
+class ResultCache:
+    """
+    On-disk memoization of work unit results, stored in SQLite.
+
+    Entries are keyed by a content hash of everything the result depends on (see make_key()).
+    Each lookup refreshes an entry's last use, and once the cache holds more than max_entries
+    results the least recently used ones are evicted. SQLite's write-ahead log and locking make
+    it safe to share one cache file between several processes, e.g. concurrent sweeps.
+    The number of entries is kept up to date by triggers, so it is never counted after the file
+    is first opened.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        # Connections can't be shared between processes, so one is opened per process on first use
+        self.connection = None
+        self.connection_pid = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            self.connection_pid = os.getpid()
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            with self.connection:
+                self.connection.execute("BEGIN IMMEDIATE")
+                self.connection.execute("""
+                    CREATE TABLE IF NOT EXISTS results (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        last_used REAL NOT NULL
+                    )""")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+                self.connection.execute("""
+                    CREATE TABLE IF NOT EXISTS entry_count (
+                        id INTEGER PRIMARY KEY CHECK (id = 0),
+                        entries INTEGER NOT NULL
+                    )""")
+                # Files written before the count was kept are counted once
+                if self.connection.execute("SELECT 1 FROM entry_count").fetchone() is None:
+                    self.connection.execute("INSERT INTO entry_count SELECT 0, COUNT(*) FROM results")
+                self.connection.execute("""
+                    CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+                        UPDATE entry_count SET entries = entries + 1;
+                    END""")
+                self.connection.execute("""
+                    CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+                        UPDATE entry_count SET entries = entries - 1;
+                    END""")
+        return self.connection
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        SHA-256 of the JSON encoding of parts, which must be JSON serializable
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> "tuple | None":
+        connection = self.connect()
+        row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return tuple(json.loads(row[0]))
+
+    def put(self, key: str, value: tuple) -> None:
+        connection = self.connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete doesn't fire the trigger
+            connection.execute("""
+                INSERT INTO results (key, value, last_used) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, last_used = excluded.last_used""",
+                               (key, json.dumps(value), time.time()))
+            excess = connection.execute("SELECT entries FROM entry_count").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute("""
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM results ORDER BY last_used LIMIT ?
+                    )""", (excess,))
+
+    def clear(self) -> None:
+        self.connect().execute("DELETE FROM results")
+
+    def __len__(self) -> int:
+        return self.connect().execute("SELECT entries FROM entry_count").fetchone()[0]
+
+    def __getstate__(self) -> dict:
+        # Send only the settings to worker processes, not the open connection
+        return {"path": self.path, "max_entries": self.max_entries}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
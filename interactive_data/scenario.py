@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+
+def liters_to_gal(liters: float) -> float:
+    return liters / 3.78541
+
+
+@dataclass(frozen=True, slots=True)
+class Scenario:
+    """
+    Parameters of one colony mission. Scenarios are immutable and hashable, so they can be
+    used as dictionary keys and sent to worker processes. Use dataclasses.replace() to make
+    a variation of an existing scenario.
+
+    The start water and storage capacity follow from the number of people, unless they are set
+    with start_water_override or max_water_stored_override, which can also be swept.
+    """
+
+    # Time
+    flight_days: int = 214
+    colony_days: int = 3650
+
+    num_people: int = 20
+
+    mining_fail_chance: float = 0.05
+
+    mining_setup_period: int = 60
+    days_until_farming: int = 60
+    farming_water_used: float = 140 / 7 # Soybeans require 140 gal per week
+
+    recycle_percentage: float = 0.85
+
+    # Gallons, None to derive them from num_people
+    start_water_override: "float | None" = None
+    max_water_stored_override: "float | None" = None
+
+    @property
+    def start_water(self) -> float:
+        if self.start_water_override is not None:
+            return self.start_water_override
+        # ISS has 1920 liters of water for 7 people for 3 months
+        # https://ntrs.nasa.gov/api/citations/20180006341/downloads/20180006341.pdf
+        return (7/3) * liters_to_gal(1920 * (self.num_people / 7))
+
+    @property
+    def max_water_stored(self) -> float:
+        if self.max_water_stored_override is not None:
+            return self.max_water_stored_override
+        # https://www.nasa.gov/sites/default/files/atoms/files/mars_ice_drilling_assessment_v6_for_public_release.pdf
+        return (self.num_people) * liters_to_gal(1000 * 20)
+
+    @property
+    def water_ration_threshold(self) -> float:
+        return self.start_water * 2
+
+    @property
+    def total_days(self) -> int:
+        return self.flight_days + self.colony_days
+
+
+DEFAULT_SCENARIO = Scenario()
@@ -1,319 +1,244 @@
 import random
-import csv
-import matplotlib.pyplot as plt
+import numpy as np
+from colony_kernel import simulate_colony
+from scenario import DEFAULT_SCENARIO, Scenario
+from trajectory import TRAJECTORY_METRICS, Trajectory
+from trajectory_sinks import DAILY_LOG_COLUMNS, open_sink
+from trial_stats import BAND_PERCENTILES, TRAJECTORY_BINS, TrajectoryBands
 # from matplotlib import animation
 
 # Variables
 filename = "data.csv"
 
-def liters_to_gal(liters: float) -> float:
-    return liters / 3.78541
+# Trajectories simulated before they are added to the bands, which bounds the memory used
+BLOCK_TRIALS = 128
 
-# Time
-FLIGHT_DAYS: int = 214
-COLONY_DAYS: int = 3650
+# Most points drawn for each metric by plot_bands()
+PLOT_POINTS = 1000
 
-NUM_PEOPLE = 20
+def get_daily_log(trajectory: Trajectory, days_run: int, scenario: Scenario = DEFAULT_SCENARIO) -> np.ndarray:
+    """
+    Rows of the daily log (DAILY_LOG_COLUMNS) for the first days_run days of a trajectory.
+    Days count from 1 again once the colony lands, and so do the running totals.
+    """
+    flight_days = min(days_run, scenario.flight_days)
+    water_stored, water_used, water_lost, water_recycled, water_gained = trajectory.data[:, :days_run]
 
-# ISS has 1920 liters of water for 7 people for 3 months
-# https://ntrs.nasa.gov/api/citations/20180006341/downloads/20180006341.pdf
-START_WATER = (7/3) * liters_to_gal(1920 * (NUM_PEOPLE / 7))
+    rows = np.empty((days_run, len(DAILY_LOG_COLUMNS)))
+    rows[:, 0] = np.concatenate((np.arange(1, flight_days + 1), np.arange(1, days_run - flight_days + 1)))
+    rows[:, 1:6] = np.column_stack((water_stored, water_used, water_gained, water_lost, water_recycled))
 
-# https://www.nasa.gov/sites/default/files/atoms/files/mars_ice_drilling_assessment_v6_for_public_release.pdf
-MAX_WATER_STORED = (NUM_PEOPLE) * liters_to_gal(1000 * 20)
+    for phase, totals in (
+        (slice(0, flight_days), (water_used, water_lost, water_gained, water_recycled)),
+        # The colonization rows have always had the water gained in the Total Water Used column
+        (slice(flight_days, days_run), (water_gained, water_lost, water_gained, water_recycled)),
+    ):
+        rows[phase, 6:10] = np.cumsum(np.column_stack(totals)[phase], axis=0)
 
-END_OF_WATER_RATIONING = 60
+    return rows
 
-MINING_FAIL_CHANCE = 0.05
 
-MINING_SETUP_PERIOD = 60
-DAYS_UNTIL_FARMING = 60
-FARMING_WATER_USED = 140 / 7 # Soybeans require 140 gal per week
+def print_statistics(water_stored: float, metrics: np.ndarray, name: str = "Total") -> None:
+    """
+    Prints the water left and the sums of a (metrics, days) slice of a trajectory
+    """
+    _, water_used, water_lost, water_recycled, water_gained = metrics.sum(axis=1)
+    print(f"Water left in storage: {water_stored:.2f}")
+    print(f"{name} Water Used: {water_used:.2f} L | {name} Water Lost: {water_lost:.2f}")
+    print(f"{name} Water Gained: {water_gained:.2f} L | {name} Water Recycled: {water_recycled:.2f}")
 
-WATER_RATION_THRESHOLD = START_WATER * 2
 
-# Total Water Lost
-total_water_used: float = 0
-total_water_lost: float = 0
-total_water_recycled: float = 0
-RECYCLE_PERCENTAGE: float = 0.85
-water_stored: float = START_WATER
+def write_daily_log(log_filename: str, trajectory: Trajectory, days_run: int,
+                    scenario: Scenario = DEFAULT_SCENARIO) -> None:
+    """
+    Writes the daily log of a trajectory (CSV, Parquet or a directory of .npy columns depending
+    on the file name)
+    """
+    with open_sink(log_filename) as writer:
+        writer.write_rows(get_daily_log(trajectory, days_run, scenario))
 
-water_stored_list = []
-water_used_list = []
-water_lost_list = []
-water_recycled_list = []
-water_gained_list = []
 
-# Water Extraction
-total_water_gained: int = 0
+def print_summary(trajectory: Trajectory, days_run: int, scenario: Scenario = DEFAULT_SCENARIO) -> None:
+    """
+    Prints the water statistics of the flight, the colonization and the whole mission
+    """
+    flight_days = min(days_run, scenario.flight_days)
+    water_stored = trajectory.water_stored[days_run - 1] if days_run else scenario.start_water
 
-# Simulation
-current_water = 0
+    print("\nSpace water statistics: ")
+    print_statistics(trajectory.water_stored[flight_days - 1] if flight_days else scenario.start_water,
+                     trajectory.data[:, :flight_days])
 
+    print("\nColonization water statistics: ")
+    print_statistics(water_stored, trajectory.data[:, flight_days:days_run], "Colonization")
 
-def get_recycle_percentage() -> float:
+    print("\nTotal statistics: ")
+    print_statistics(water_stored, trajectory.data[:, :days_run])
+
+
+def simulate(water_mined_per_day: float, rng: "random.Random | None" = None,
+             log_filename: "str | None" = None, verbose: bool = False,
+             scenario: Scenario = DEFAULT_SCENARIO) -> Trajectory:
     """
-    Recycling has a maximum of 85% efficiency, but some of the recycling machines may break, decreasing efficiency (temporarily)
+    Simulates one colony with colony_kernel.simulate_colony() and returns its daily water metrics.
+    Pass a seeded random.Random as rng to make the run reproducible. The daily log is only
+    written if log_filename is given, and the summary statistics are only printed if verbose.
     """
-    return (RECYCLE_PERCENTAGE + (random.random() * 0.1) - 0.05)
+    if rng is None:
+        rng = random.Random()
 
+    # Days after failure stay at zero in the trajectory
+    trajectory = Trajectory(scenario.total_days)
+    days_run = simulate_colony(water_mined_per_day, rng.getrandbits(64), scenario, trajectory.data)[3]
 
-# Returns a random percentage up to 10% to indicate alteration
-def get_water_deviation() -> float:
-    #-5% to 5% deviation
-    return random.random() * 0.2 - 0.1
+    if log_filename is not None:
+        write_daily_log(log_filename, trajectory, days_run, scenario)
+    if verbose:
+        print_summary(trajectory, days_run, scenario)
 
-    # Returns the water usage for an individual with the alterations accounted for
+    return trajectory
 
 
-def get_individual_water_usage(base_water: float) -> float:
-    return base_water * (1 + get_water_deviation())
+def simulate_bands(water_mined_per_day: float, num_trials: int, rng: "random.Random | None" = None,
+                   scenario: Scenario = DEFAULT_SCENARIO, bins: int = TRAJECTORY_BINS) -> TrajectoryBands:
+    """
+    Simulates num_trials colonies and reduces their trajectories to per-day histograms, from which
+    plot_bands() draws percentile bands. Only BLOCK_TRIALS trajectories are held at a time.
+    Pass a seeded random.Random as rng to make the run reproducible.
+    """
+    if rng is None:
+        rng = random.Random()
 
+    bands = TrajectoryBands(len(TRAJECTORY_METRICS), scenario.total_days, bins)
+    block = np.empty((min(BLOCK_TRIALS, num_trials), len(TRAJECTORY_METRICS), scenario.total_days))
 
-def get_individual_space_water_usage() -> "tuple[float, float]":
-    water_used = 0
-    water_recycled = 0
+    for first_trial in range(0, num_trials, len(block)):
+        trajectories = block[:num_trials - first_trial]
+        # Days after failure stay at zero
+        trajectories.fill(0)
+        for data in trajectories:
+            simulate_colony(water_mined_per_day, rng.getrandbits(64), scenario, data)
+        bands.add(trajectories)
 
-    # ISS Astronauts use 3 gal per day
-    water_used = 3
-    water_used *= (1 + get_water_deviation())
-    water_recycled = get_recycle_percentage() * water_used
+    return bands
 
-    return (water_used, water_recycled)
 
-def simulate() -> None:
+def get_lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of at most points samples of the series (x, y) that keep its visual shape, picked with
+    Largest-Triangle-Three-Buckets: the first and last samples, then from each bucket the sample
+    making the largest triangle with the previous pick and the mean of the next bucket.
+    https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+    """
+    samples = len(x)
+    if points >= samples or points < 3:
+        return np.arange(samples)
+
+    # Bucket boundaries of the samples between the first and the last
+    edges = np.linspace(1, samples - 1, points - 1).astype(np.int64)
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = samples - 1
+
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else samples
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        previous = indices[bucket]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        indices[bucket + 1] = start + np.argmax(areas)
+
+    return indices
+
+
+def plot_bands(bands: TrajectoryBands, percentiles=BAND_PERCENTILES, points: int = PLOT_POINTS) -> None:
+    """
+    Fan chart of the same metrics as plot_trajectory() across every trial in bands: the median
+    of every day as a line, with the pairs of percentiles around it shaded, the outermost lightest.
+    Every metric is drawn at the union of the LTTB samples of its percentiles, at most points days.
+    """
+    # Imported here so that importing this module doesn't load matplotlib
+    import matplotlib.pyplot as plt
+
+    values = bands.get_percentiles(percentiles)
+    days = np.arange(1, values.shape[2] + 1)
+    pairs = len(percentiles) // 2
+
+    fig, axs = plt.subplots(3)
+    fig.set_size_inches(12, 8)
+    fig.suptitle(f"Water Usage on Mars ({bands.trials} colonies, "
+                 + ", ".join(f"{percentiles[pair]}-{percentiles[-1 - pair]}%" for pair in range(pairs)) + ")")
+    fig.supxlabel("Days Since Mission Start")
+
+    for ax, metrics in zip(axs, (
+        (("water_stored", "tab:blue", "Water Stored"),),
+        (("water_used", "red", "Water Used"), ("water_lost", "orange", "Water Lost"),
+         ("water_recycled", "green", "Water Recycled")),
+        (("water_gained", "green", "Daily Water Mined"),),
+    )):
+        for metric, color, label in metrics:
+            series = values[:, TRAJECTORY_METRICS.index(metric)]
+            indices = np.unique(np.concatenate([
+                get_lttb_indices(days, percentile_series, max(points // len(percentiles), 3))
+                for percentile_series in series
+            ]))
+            for pair in range(pairs):
+                ax.fill_between(days[indices], series[pair, indices], series[-1 - pair, indices],
+                                color=color, alpha=0.15 * (pair + 1), lw=0)
+            # The median, with an odd number of percentiles
+            ax.plot(days[indices], series[len(percentiles) // 2, indices], c=color, lw=1, label=label)
+        ax.legend()
+        ax.set(ylabel="Water (gal)")
+
+    plt.show()
+
+
+def plot_trajectory(trajectory: Trajectory) -> None:
+    """
+    Plots the water stored, used, lost, recycled and mined every day of a simulated colony
+    """
+    # Imported here so that importing this module doesn't load matplotlib
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(3)
+    fig.set_size_inches(12, 8)
+    fig.suptitle("Water Usage on Mars")
+    fig.supxlabel("Days Since Mission Start")
+
+    # for ax in axs:
+    #     ax.xlabel("Days since mission launch")
+
+    axs[0].plot(trajectory.days, trajectory.water_stored)
+    axs[0].legend(["Water Stored"])
+    axs[0].set(ylabel="Water (gal)")
+
+    axs[1].scatter(trajectory.days, trajectory.water_used, c="red", s=0.5)
+    axs[1].scatter(trajectory.days, trajectory.water_lost, c="orange", s=0.5)
+    axs[1].scatter(trajectory.days, trajectory.water_recycled, c="green", s=0.5)
+    axs[1].legend(["Water Used", "Water Lost", "Water Recycled"])
+    axs[1].set(ylabel="Water (gal)")
+
+    axs[2].scatter(trajectory.days, trajectory.water_gained, c="green", s=0.5)
+    axs[2].legend(["Daily Water Mined"])
+    axs[2].set(ylabel="Water (gal)")
+
+    plt.show()
+
+
+def main() -> None:
     water_mined_per_day = int(
         input("What should be the maximum water mining capacity (in gallons)? "))
+    num_trials = int(input("How many colonies should be simulated? (1 logs and plots a single colony) ") or 1)
+
+    if num_trials > 1:
+        plot_bands(simulate_bands(water_mined_per_day, num_trials))
+        return
+
+    trajectory = simulate(water_mined_per_day, log_filename=filename, verbose=True)
+    plot_trajectory(trajectory)
+
 
-    global total_water_used
-    global total_water_lost
-    global total_water_recycled
-    global total_water_gained
-    global water_stored
-    total_water_used = 0
-    total_water_lost = 0
-    total_water_recycled = 0
-    total_water_gained = 0
-    water_stored = 0
-
-    global water_stored_list
-    global water_used_list
-    global water_lost_list
-    global water_recycled_list
-    global water_gained_list
-
-    failed :bool = False
-
-    # Open the CSV file in write mode and create a CSV writer
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-
-        writer.writerow(["Day", "Water Stored", "Water Used Today", "Water Gained Today",
-                        "Water Lost Today", "Water Recycled Today",
-                        "Total Water Used", "Total Water Lost",
-                        "Total Water Gained", "Total Water Recycled"])
-
-        water_stored = START_WATER
-
-        # During Flight
-        for day in range(1, FLIGHT_DAYS + 1):
-            if failed:
-                water_stored_list.append(0)
-                water_gained_list.append(0)
-                water_recycled_list.append(0)
-                water_used_list.append(0)
-                water_lost_list.append(0)
-                continue
-            else:
-                failed = water_stored <= 0
-            water_used_today = 0
-            water_lost_today = 0
-            water_recycled_today = 0
-
-            for x in range(NUM_PEOPLE):
-                individual_water, individual_recycled = get_individual_space_water_usage()
-                water_used_today += individual_water
-                water_recycled_today += individual_recycled
-
-            water_lost_today = water_used_today - water_recycled_today
-
-            total_water_used += water_used_today
-            total_water_lost += water_lost_today
-            total_water_recycled += water_recycled_today
-
-            water_stored -= water_lost_today
-            water_stored = max(water_stored, 0)
-
-            water_stored_list.append(water_stored)
-            water_gained_list.append(0)
-            water_recycled_list.append(water_recycled_today)
-            water_used_list.append(water_used_today)
-            water_lost_list.append(water_lost_today)
-
-            # Save the data
-            writer.writerow([day, water_stored, water_used_today, 0,
-                            water_lost_today, water_recycled_today,
-                            total_water_used, total_water_lost,
-                            total_water_gained, total_water_recycled])
-
-            # print(f"Day: {day} | Water Left: {water_stored} L | Water Used: {water_used_today} | ", end="")
-            # print(f"Water Lost: {water_lost_today} L | Water Recycled: {water_recycled_today} | ", end="")
-            # print(f"Total Water Used: {total_water_used} L | Total Water Lost: {total_water_lost} | ", end="")
-            # print(f"Total Water Gained: {total_water_gained} L | Total Water Recycled: {total_water_recycled}")
-        
-        print("\nSpace water statistics: ")
-        print(f"Water left in storage: {water_stored:.2f}")
-        print(f"Total Water Used: {total_water_used:.2f} L | Total Water Lost: {total_water_lost:.2f}")
-        print(f"Total Water Gained: {total_water_gained:.2f} L | Total Water Recycled: {total_water_recycled:.2f}")
-
-        colonization_water_used = 0.0
-        colonization_water_lost = 0.0
-        colonization_water_gained = 0.0
-        colonization_water_recycled = 0.0
-
-        days_failing = 0
-        fail_percent = 0
-        mining_efficiency = 1
-
-        # During Colonization
-        for day in range(1, COLONY_DAYS + 1):
-            if failed:
-                water_stored_list.append(0)
-                water_gained_list.append(0)
-                water_recycled_list.append(0)
-                water_used_list.append(0)
-                water_lost_list.append(0)
-                continue
-            else:
-                failed = water_stored <= 0
-            water_used_today = 0
-            water_lost_today = 0
-            water_recycled_today = 0
-
-            for x in range(NUM_PEOPLE):
-                # Colonists split up water rations over a schedule 
-                cycle = x + day
-                if water_stored < WATER_RATION_THRESHOLD:
-                    # 2.5 gal hygiene
-                    # 1 gal drinking
-                    individual_water = get_individual_water_usage(3.5)
-                    if cycle % 3 == 0:
-                        # shower (20 gal) (every 3 days)
-                        individual_water += get_individual_water_usage(20)
-                    if cycle % 4 == 0:
-                        # Washing machine (15 gal) (every 4 days)
-                        individual_water += get_individual_water_usage(15)
-                    if cycle % 2 == 0:
-                        # Dishwasher (5 gal) (every 2 days)
-                        individual_water += get_individual_water_usage(5)
-                elif water_stored < START_WATER:
-                    # if there is nearly no water, cut water usage to only basic needs
-                    individual_water = get_individual_water_usage(3.5)
-                else:
-                    # 5 gal dishwasher
-                    # 20 gal shower
-                    # space toilet = no water
-                    # 2.5 gal hygiene
-                    # 1 gal drinking
-                    individual_water = get_individual_water_usage(5 + 20 + 2.5 + 1)
-                    if cycle % 4 == 0:
-                        # Washing machine (15 gal) (every 4 days)
-                        individual_water += get_individual_water_usage(15)
-                water_used_today += individual_water
-                water_recycled_today += individual_water * get_recycle_percentage()
-
-            if day > DAYS_UNTIL_FARMING:
-                water_used_today += FARMING_WATER_USED
-
-            water_lost_today = water_used_today - water_recycled_today
-
-            # Mining productivity goes up 5% at a time for the first 30 days
-            setup_factor = round(min(1, day / MINING_SETUP_PERIOD) * 20) / 20
-
-            # 20% deviation in mining + setup factor
-            water_mined_today = water_mined_per_day * (1 + random.random() * 0.4 - 0.2) * setup_factor * mining_efficiency
-
-            # Mining efficiency will vary by up to +-5%
-            mining_efficiency += (random.random() * 0.1 - 0.05)
-            # Mining efficiency goes from 20 - 100%
-            mining_efficiency = max(min(1, mining_efficiency), 0.2)
-
-            # A machine can fail for up to 5 days
-            if (random.random() < MINING_FAIL_CHANCE):
-                days_failing = random.randint(1, 5)
-                fail_percent = random.random()
-
-            if (days_failing > 0):
-                water_mined_today *= fail_percent
-                days_failing -= 1
-
-            water_gained_today = water_mined_today
-
-            colonization_water_lost += water_lost_today
-            colonization_water_used += water_used_today
-            colonization_water_recycled += water_recycled_today
-            colonization_water_gained += water_gained_today
-            
-            total_water_lost += water_lost_today
-            total_water_used += water_used_today
-            total_water_recycled += water_recycled_today
-            total_water_gained += water_gained_today
-
-            water_stored += water_gained_today - water_lost_today
-            # Stop water stored from exceeding max
-            water_stored = min(water_stored, MAX_WATER_STORED)
-            water_stored = max(water_stored, 0)
-
-            water_stored_list.append(water_stored)
-            water_gained_list.append(water_gained_today)
-            water_recycled_list.append(water_recycled_today)
-            water_used_list.append(water_used_today)
-            water_lost_list.append(water_lost_today)
-
-            # Print daily statistics
-            writer.writerow([day, water_stored, water_used_today, water_gained_today,
-                            water_lost_today, water_recycled_today,
-                            colonization_water_gained, colonization_water_lost,
-                            colonization_water_gained, colonization_water_recycled])
-
-        
-
-        print("\nColonization water statistics: ")
-        print(f"Water left in storage: {water_stored:.2f}")
-        print(f"Colonization Water Used: {colonization_water_used:.2f} L | Colonization Water Lost: {colonization_water_lost:.2f}")
-        print(f"Colonization Water Gained: {colonization_water_gained:.2f} L | Colonization Water Recycled: {colonization_water_recycled:.2f}")
-        
-        print("\nTotal statistics: ")
-        print(f"Water left in storage: {water_stored:.2f}")
-        print(f"Total Water Used: {total_water_used:.2f} L | Total Water Lost: {total_water_lost:.2f}")
-        print(f"Total Water Gained: {total_water_gained:.2f} L | Total Water Recycled: {total_water_recycled:.2f}")
-
-
-simulate()
-
-days_list = [day for day in range(1, FLIGHT_DAYS + COLONY_DAYS + 1)]
-
-fig, axs = plt.subplots(3)
-fig.set_size_inches(12, 8)
-fig.suptitle("Water Usage on Mars")
-fig.supxlabel("Days Since Mission Start")
-
-# for ax in axs:
-#     ax.xlabel("Days since mission launch")
-
-axs[0].plot(days_list, water_stored_list)
-axs[0].legend(["Water Stored"])
-axs[0].set(ylabel="Water (gal)")
-
-axs[1].scatter(days_list, water_used_list, c="red", s=0.5)
-axs[1].scatter(days_list, water_lost_list, c="orange", s=0.5)
-axs[1].scatter(days_list, water_recycled_list, c="green", s=0.5)
-axs[1].legend(["Water Used", "Water Lost", "Water Recycled"])
-axs[1].set(ylabel="Water (gal)")
-
-axs[2].scatter(days_list, water_gained_list, c="green", s=0.5)
-axs[2].legend(["Daily Water Mined"])
-axs[2].set(ylabel="Water (gal)")
-
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
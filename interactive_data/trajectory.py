@@ -0,0 +1,32 @@
+import numpy as np
+
+# Daily metrics kept by a Trajectory, in row order
+TRAJECTORY_METRICS = ("water_stored", "water_used", "water_lost", "water_recycled", "water_gained")
+
+
+class Trajectory:
+    """
+    Daily water metrics of one simulated colony, stored as one preallocated float64 row per metric.
+
+    Days after the colony fails stay at zero. Every metric is a view into the same
+    (metrics, days) array, so it can be handed to matplotlib or a sink without copying.
+    """
+
+    __slots__ = ("data", "days", *TRAJECTORY_METRICS)
+
+    def __init__(self, num_days: int) -> None:
+        self.data = np.zeros((len(TRAJECTORY_METRICS), num_days))
+        # Day numbers since mission start, starting at 1
+        self.days = np.arange(1, num_days + 1)
+        for row, metric in enumerate(TRAJECTORY_METRICS):
+            setattr(self, metric, self.data[row])
+
+    def record(self, index: int, water_stored: float, water_used: float, water_lost: float,
+               water_recycled: float, water_gained: float) -> None:
+        """
+        Stores the metrics of the day at index (0 is the first day of the mission)
+        """
+        self.data[:, index] = (water_stored, water_used, water_lost, water_recycled, water_gained)
+
+    def __len__(self) -> int:
+        return self.data.shape[1]
@@ -0,0 +1,212 @@
+import csv
+import json
+import os
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Column layout of the daily log written by simulation.py
+DAILY_LOG_COLUMNS = ["Day", "Water Stored", "Water Used Today", "Water Gained Today",
+                     "Water Lost Today", "Water Recycled Today",
+                     "Total Water Used", "Total Water Lost",
+                     "Total Water Gained", "Total Water Recycled"]
+
+# Columns that hold whole numbers, written without a decimal point in CSV logs
+INTEGER_COLUMNS = ("Day",)
+
+# Rows kept in memory before they are written out
+BUFFER_ROWS = 8192
+
+# Fixed size of the .npy headers written by NpySink, so they can be rewritten in place once
+# the final number of rows is known
+NPY_HEADER_SIZE = 128
+
+
+class TrajectorySink:
+    """
+    Collects daily records in a preallocated buffer and writes them out in batches.
+
+    Use write_row() for one day at a time, or write_rows() to hand over a whole (rows, columns)
+    array, for example a full trajectory, without going through the buffer.
+    Subclasses implement write_block(), which gets a float64 array of complete rows.
+    """
+
+    def __init__(self, columns: 'list[str]' = DAILY_LOG_COLUMNS, buffer_rows: int = BUFFER_ROWS) -> None:
+        self.columns = list(columns)
+        self.buffer_rows = buffer_rows
+        self.buffer = np.empty((buffer_rows, len(self.columns)))
+        self.buffered_rows = 0
+        self.rows_written = 0
+
+    def write_row(self, row) -> None:
+        self.buffer[self.buffered_rows] = row
+        self.buffered_rows += 1
+        if self.buffered_rows == len(self.buffer):
+            self.flush()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim != 2 or rows.shape[1] != len(self.columns):
+            raise ValueError(f"Expected rows with {len(self.columns)} columns, got shape {rows.shape}")
+        self.flush()
+        self.write_block(rows)
+        self.rows_written += len(rows)
+
+    def flush(self) -> None:
+        if self.buffered_rows:
+            self.write_block(self.buffer[:self.buffered_rows])
+            self.rows_written += self.buffered_rows
+            self.buffered_rows = 0
+
+    def write_block(self, rows: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'TrajectorySink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CsvSink(TrajectorySink):
+    """
+    Writes the same CSV layout as before, one header row followed by the records.
+    INTEGER_COLUMNS, such as the day, are written as integers.
+    """
+
+    def __init__(self, filename: str, columns: 'list[str]' = DAILY_LOG_COLUMNS, buffer_rows: int = BUFFER_ROWS) -> None:
+        # Single rows are kept in row_buffer below instead of a float buffer
+        super().__init__(columns, 0)
+        self.buffer_rows = buffer_rows
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+        # Rows are kept as given rather than copied into the float buffer, so integer columns
+        # such as the day stay integers in the file
+        self.row_buffer = []
+
+    def write_row(self, row) -> None:
+        self.row_buffer.append(row)
+        if len(self.row_buffer) == self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.row_buffer:
+            self.writer.writerows(self.row_buffer)
+            self.rows_written += len(self.row_buffer)
+            self.row_buffer = []
+
+    def write_block(self, rows: np.ndarray) -> None:
+        columns = [rows[:, column].astype(np.int64).tolist() if name in INTEGER_COLUMNS else rows[:, column].tolist()
+                   for column, name in enumerate(self.columns)]
+        self.writer.writerows(zip(*columns))
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+
+class NpySink(TrajectorySink):
+    """
+    Writes a directory with one float64 .npy file per column, plus columns.json mapping the
+    column names to the files. Blocks are appended as raw bytes and the headers are fixed up on
+    close, so memory use doesn't grow with the length of the log.
+    Read it back with load_npy_log().
+    """
+
+    def __init__(self, path: str, columns: 'list[str]' = DAILY_LOG_COLUMNS, buffer_rows: int = BUFFER_ROWS) -> None:
+        super().__init__(columns, buffer_rows)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.filenames = [column.lower().replace(" ", "_") + ".npy" for column in self.columns]
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump(dict(zip(self.columns, self.filenames)), f, indent=4)
+
+        self.files = [open(os.path.join(path, filename), "wb") for filename in self.filenames]
+        for file in self.files:
+            write_npy_header(file, 0)
+
+    def write_block(self, rows: np.ndarray) -> None:
+        for column, file in enumerate(self.files):
+            file.write(np.ascontiguousarray(rows[:, column]).tobytes())
+
+    def close(self) -> None:
+        super().close()
+        for file in self.files:
+            file.seek(0)
+            write_npy_header(file, self.rows_written)
+            file.close()
+
+
+class ParquetSink(TrajectorySink):
+    """
+    Writes a Parquet file with one row group per flushed block. Needs pyarrow.
+    """
+
+    def __init__(self, filename: str, columns: 'list[str]' = DAILY_LOG_COLUMNS, buffer_rows: int = BUFFER_ROWS) -> None:
+        if pyarrow is None:
+            raise ImportError("Writing Parquet logs requires pyarrow")
+        super().__init__(columns, buffer_rows)
+        schema = pyarrow.schema([(column, pyarrow.float64()) for column in self.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, schema)
+
+    def write_block(self, rows: np.ndarray) -> None:
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(rows[:, column]) for column in range(len(self.columns))], names=self.columns))
+
+    def close(self) -> None:
+        super().close()
+        self.writer.close()
+
+
+class NullSink(TrajectorySink):
+    """
+    Discards every record, for runs that don't keep a log
+    """
+
+    def write_row(self, row) -> None:
+        pass
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        pass
+
+
+def write_npy_header(file, rows: int) -> None:
+    """
+    Writes a version 1.0 .npy header for a 1D float64 array, padded to NPY_HEADER_SIZE bytes
+    """
+    header = repr({'descr': '<f8', 'fortran_order': False, 'shape': (rows,)})
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    file.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1"))
+
+
+def load_npy_log(path: str, mmap_mode: "str | None" = "r") -> 'dict[str, np.ndarray]':
+    """
+    Loads a log written by NpySink as a dictionary of column name to array.
+    The arrays are memory-mapped by default, so only the parts that are used are read.
+    """
+    with open(os.path.join(path, "columns.json")) as f:
+        filenames = json.load(f)
+    return {column: np.load(os.path.join(path, filename), mmap_mode=mmap_mode) for column, filename in filenames.items()}
+
+
+def open_sink(path: "str | None", columns: 'list[str]' = DAILY_LOG_COLUMNS, buffer_rows: int = BUFFER_ROWS) -> TrajectorySink:
+    """
+    Picks the backend from the file name: .csv and .parquet files, otherwise an NpySink directory.
+    No path gives a NullSink.
+    """
+    if path is None:
+        return NullSink(columns, 0)
+    if path.endswith(".csv"):
+        return CsvSink(path, columns, buffer_rows)
+    if path.endswith(".parquet"):
+        return ParquetSink(path, columns, buffer_rows)
+    return NpySink(path, columns, buffer_rows)
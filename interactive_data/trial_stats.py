@@ -0,0 +1,489 @@
+import math
+import numpy as np
+from scenario import DEFAULT_SCENARIO, Scenario
+
+# Percentiles reported for the water left and days survived, in pairs around the median
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Bins of the water left histogram, which are fitted to the spread of the water left
+WATER_BINS = 1000
+
+# Bins of every metric on every day of a TrajectoryBands
+TRAJECTORY_BINS = 200
+# Narrowest bin of a histogram fitted to its values, 2**MIN_BIN_EXPONENT gallons, for when every
+# value is (nearly) the same
+MIN_BIN_EXPONENT = -20
+
+
+def get_dyadic_grid(minimums: np.ndarray, maximums: np.ndarray, bins: int, exponents: np.ndarray,
+                    origins: np.ndarray, min_exponents: np.ndarray) -> 'tuple[np.ndarray, np.ndarray]':
+    """
+    Grid of histograms whose bins are 2**exponent wide and start at origin * 2**exponent.
+    Returns the (exponents, origins) of bins no narrower than 2**min_exponents that cover the
+    range from minimums to maximums of every histogram. Histograms whose current exponents and
+    origins already do keep them, the others get the narrowest power of two, with the range
+    centred in the bins so that they cover it for longer.
+    """
+    covered = ((exponents >= min_exponents)
+               & (np.floor(np.ldexp(minimums, -exponents)) >= origins)
+               & (np.floor(np.ldexp(maximums, -exponents)) < origins + bins))
+
+    with np.errstate(divide="ignore"):
+        needed = np.ceil(np.log2(np.maximum(maximums - minimums, 0) / (bins - 1)))
+    new_exponents = np.maximum(needed.clip(MIN_BIN_EXPONENT, None).astype(np.int64), min_exponents)
+    while True:
+        lows = np.floor(np.ldexp(minimums, -new_exponents)).astype(np.int64)
+        highs = np.floor(np.ldexp(maximums, -new_exponents)).astype(np.int64)
+        # Rounding can leave the range one bin too wide, which the next power of two fixes
+        too_wide = highs - lows >= bins
+        if not too_wide.any():
+            break
+        new_exponents[too_wide] += 1
+    new_origins = lows - (bins - 1 - (highs - lows)) // 2
+
+    return np.where(covered, exponents, new_exponents), np.where(covered, origins, new_origins)
+
+
+def regrid_counts(counts: np.ndarray, exponents: np.ndarray, origins: np.ndarray, new_exponents: np.ndarray,
+                  new_origins: np.ndarray) -> np.ndarray:
+    """
+    Returns counts, with bins along the last axis on the grid of exponents and origins (see
+    get_dyadic_grid()), moved to bins of new_exponents and new_origins, which must be no narrower
+    and cover every value counted. Wider powers of two merge whole bins, so the move is exact.
+    """
+    changed = (new_exponents != exponents) | (new_origins != origins)
+    if not changed.any():
+        return counts
+
+    bins = counts.shape[-1]
+    counts = counts.copy()
+    changed_counts = counts[changed]
+    # A bin of the old grid lies entirely in the bin of the new grid holding its start
+    shifts = (new_exponents - exponents)[changed][:, None]
+    indices = ((origins[changed][:, None] + np.arange(bins)) >> shifts) - new_origins[changed][:, None]
+    # Bins outside the new grid are empty
+    np.clip(indices, 0, bins - 1, out=indices)
+    indices += np.arange(len(changed_counts))[:, None] * bins
+    counts[changed] = np.bincount(indices.ravel(), weights=changed_counts.ravel(),
+                                  minlength=changed_counts.size).reshape(changed_counts.shape)
+    return counts
+
+
+class RunningStats:
+    """
+    Count, mean and variance of a stream of values in O(1) memory, using Welford's update.
+    The stats of two separate streams merge into the stats of both, so every worker can keep
+    its own and the main process combines them.
+    https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0) -> None:
+        self.count = count
+        self.mean = mean
+        # Sum of squared differences from the mean
+        self.m2 = m2
+
+    def add(self, values) -> None:
+        """
+        Adds one value or an array of values
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        # A batch is merged in as the stats of its own values, which for a single value is
+        # Welford's update
+        mean = float(values.mean())
+        self.merge(RunningStats(len(values), mean, float(((values - mean)**2).sum())))
+
+    def merge(self, other: 'RunningStats') -> None:
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        """
+        Sample variance, nan with fewer than two values
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class HistogramSketch:
+    """
+    Quantiles of a stream of values between low and high, from the counts of bins equal-width bins.
+
+    Memory doesn't grow with the number of values, and sketches with the same range merge exactly
+    by adding their counts, in any order, unlike sampled or P² estimates. Quantiles are accurate to
+    a bin width, with values spread evenly within their bin, or with discrete the quantiles are
+    the centres of their bins (for whole numbers, with bins centred on them). Either way they
+    never lie outside the smallest and largest values seen. Values outside the range are counted
+    in the first or last bin.
+    """
+
+    __slots__ = ("low", "high", "counts", "discrete", "minimum", "maximum")
+
+    def __init__(self, low: float, high: float, bins: int, discrete: bool = False) -> None:
+        self.low = low
+        self.high = high
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.discrete = discrete
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    @property
+    def bin_width(self) -> float:
+        return (self.high - self.low) / len(self.counts)
+
+    def add(self, values) -> None:
+        """
+        Adds one value or an array of values
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        indices = np.clip(((values - self.low) / self.bin_width).astype(np.int64), 0, len(self.counts) - 1)
+        np.add.at(self.counts, indices, 1)
+
+    def merge(self, other: 'HistogramSketch') -> None:
+        if (self.low, self.high, len(self.counts)) != (other.low, other.high, len(other.counts)):
+            raise ValueError("Only sketches with the same range and bins can be merged")
+        self.counts += other.counts
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        Values below which the fractions q (0 to 1) of the values lie, nan if there are none
+        """
+        q = np.asarray(q, dtype=np.float64)
+        cumulative = np.cumsum(self.counts)
+        total = cumulative[-1]
+        if total == 0:
+            return np.full(q.shape, math.nan)
+
+        # Rank of the quantile, at least just above zero so the bin found always holds values
+        targets = np.maximum(q * total, np.nextafter(0, 1))
+        indices = np.minimum(np.searchsorted(cumulative, targets), len(self.counts) - 1)
+        if self.discrete:
+            values = self.low + (indices + 0.5) * self.bin_width
+        else:
+            previous = cumulative[indices] - self.counts[indices]
+            fractions = (targets - previous) / self.counts[indices]
+            values = self.low + (indices + fractions) * self.bin_width
+        return np.clip(values, self.minimum, self.maximum)
+
+    def percentiles(self, percentiles=BAND_PERCENTILES) -> np.ndarray:
+        return self.quantile(np.asarray(percentiles) / 100)
+
+    def to_state(self) -> list:
+        """
+        JSON serializable state with only the bins that have values, see from_state()
+        """
+        indices = np.flatnonzero(self.counts)
+        return [self.low, self.high, len(self.counts), self.discrete, self.minimum, self.maximum,
+                indices.tolist(), self.counts[indices].tolist()]
+
+    @classmethod
+    def from_state(cls, state) -> 'HistogramSketch':
+        low, high, bins, discrete, minimum, maximum, indices, counts = state
+        sketch = cls(low, high, bins, discrete)
+        sketch.minimum, sketch.maximum = minimum, maximum
+        sketch.counts[indices] = counts
+        return sketch
+
+
+class AdaptiveHistogramSketch:
+    """
+    Quantiles of a stream of values of any range, from the counts of bins equal-width bins fitted
+    to the values seen, like one day of a TrajectoryBands.
+
+    The bins are 2**exponent wide and start at origin * 2**exponent, the narrowest power of two
+    that covers the values (see get_dyadic_grid()), so their width follows the spread of the
+    values rather than a range fixed in advance. Sketches merge exactly by moving both to a common
+    grid. Quantiles are accurate to a bin width, with values spread evenly within their bin, and
+    never lie outside the smallest and largest values seen. The values equal to the smallest one
+    are counted separately, so a pile of them (like the 0 gal left by every failed colony) gives
+    exact quantiles instead of being spread over its bin.
+    """
+
+    __slots__ = ("counts", "exponent", "origin", "minimum", "maximum", "minimum_count")
+
+    def __init__(self, bins: int) -> None:
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.exponent = MIN_BIN_EXPONENT
+        self.origin = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        # Values equal to minimum, also counted in counts
+        self.minimum_count = 0
+
+    def add_minimum(self, minimum: float, count: int) -> None:
+        """
+        Counts count values equal to minimum, the smallest of some values being added
+        """
+        if minimum < self.minimum:
+            self.minimum, self.minimum_count = minimum, count
+        elif minimum == self.minimum:
+            self.minimum_count += count
+
+    def move_to_grid(self, min_exponent: int) -> None:
+        """
+        Moves the counts to bins no narrower than 2**min_exponent that cover minimum to maximum
+        """
+        exponents, origins = get_dyadic_grid(np.array([self.minimum]), np.array([self.maximum]), len(self.counts),
+                                             np.array([self.exponent]), np.array([self.origin]),
+                                             np.array([min_exponent]))
+        self.counts = regrid_counts(self.counts[None], np.array([self.exponent]), np.array([self.origin]),
+                                    exponents, origins)[0]
+        self.exponent, self.origin = int(exponents[0]), int(origins[0])
+
+    def add(self, values) -> None:
+        """
+        Adds one value or an array of values
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        minimum = values.min()
+        self.add_minimum(float(minimum), int(np.count_nonzero(values == minimum)))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.move_to_grid(self.exponent)
+        # Scaling by a power of two is exact, so every value lands in the bin the grid was fitted with
+        indices = np.floor(values * math.ldexp(1.0, -self.exponent)).astype(np.int64) - self.origin
+        self.counts += np.bincount(np.clip(indices, 0, len(self.counts) - 1), minlength=len(self.counts))
+
+    def merge(self, other: 'AdaptiveHistogramSketch') -> None:
+        if len(self.counts) != len(other.counts):
+            raise ValueError("Only sketches with the same bins can be merged")
+        if not other.counts.any():
+            return
+        self.add_minimum(other.minimum, other.minimum_count)
+        self.maximum = max(self.maximum, other.maximum)
+        self.move_to_grid(max(self.exponent, other.exponent))
+        self.counts += regrid_counts(other.counts[None], np.array([other.exponent]), np.array([other.origin]),
+                                     np.array([self.exponent]), np.array([self.origin]))[0]
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        Values below which the fractions q (0 to 1) of the values lie, nan if there are none
+        """
+        q = np.asarray(q, dtype=np.float64)
+        cumulative = np.cumsum(self.counts)
+        total = cumulative[-1]
+        if total == 0:
+            return np.full(q.shape, math.nan)
+
+        # The other values are spread evenly within their bins, without those equal to the minimum
+        counts = self.counts.copy()
+        counts[math.floor(math.ldexp(self.minimum, -self.exponent)) - self.origin] -= self.minimum_count
+        cumulative = np.cumsum(counts)
+        # Rank of the quantile among the other values, at least just above zero so the bin found
+        # always holds values
+        targets = np.maximum(q * total - self.minimum_count, np.nextafter(0, 1))
+        indices = np.minimum(np.searchsorted(cumulative, targets), len(counts) - 1)
+        previous = cumulative[indices] - counts[indices]
+        fractions = (targets - previous) / np.maximum(counts[indices], 1)
+        values = np.ldexp(self.origin + indices + fractions, self.exponent)
+        values = np.where(q * total <= self.minimum_count, self.minimum, values)
+        return np.clip(values, self.minimum, self.maximum)
+
+    def percentiles(self, percentiles=BAND_PERCENTILES) -> np.ndarray:
+        return self.quantile(np.asarray(percentiles) / 100)
+
+    def to_state(self) -> list:
+        """
+        JSON serializable state with only the bins that have values, see from_state()
+        """
+        indices = np.flatnonzero(self.counts)
+        return [len(self.counts), self.exponent, self.origin, self.minimum, self.maximum, self.minimum_count,
+                indices.tolist(), self.counts[indices].tolist()]
+
+    @classmethod
+    def from_state(cls, state) -> 'AdaptiveHistogramSketch':
+        bins, exponent, origin, minimum, maximum, minimum_count, indices, counts = state
+        sketch = cls(bins)
+        sketch.exponent, sketch.origin, sketch.minimum, sketch.maximum = exponent, origin, minimum, maximum
+        sketch.minimum_count = minimum_count
+        sketch.counts[indices] = counts
+        return sketch
+
+
+class TrialStats:
+    """
+    Streaming summary of the trials of one mining rate: survival count, mean and variance of the
+    water left and days survived, and histogram sketches of both for percentile bands.
+
+    Trials are added one at a time or as arrays (for example a batch chunk) and never stored,
+    so a worker uses the same memory for any number of trials. Summaries of the same scenario
+    merge, so workers can each return one and the main process combines them.
+    """
+
+    __slots__ = ("trials", "successes", "water_left", "days_survived", "water_left_sketch", "days_survived_sketch")
+
+    def __init__(self, scenario: Scenario = DEFAULT_SCENARIO, water_bins: int = WATER_BINS) -> None:
+        self.trials = 0
+        self.successes = 0
+        self.water_left = RunningStats()
+        self.days_survived = RunningStats()
+        self.water_left_sketch = AdaptiveHistogramSketch(water_bins)
+        # One bin per whole day, centred on it, so the percentiles are exact
+        self.days_survived_sketch = HistogramSketch(-0.5, scenario.total_days + 0.5, scenario.total_days + 1,
+                                                    discrete=True)
+
+    def add(self, successes, water_left, days_survived) -> None:
+        """
+        Adds the outcome of one trial, or arrays of the outcomes of several
+        """
+        successes = np.asarray(successes)
+        self.trials += successes.size
+        self.successes += int(successes.sum())
+        self.water_left.add(water_left)
+        self.days_survived.add(days_survived)
+        self.water_left_sketch.add(water_left)
+        self.days_survived_sketch.add(days_survived)
+
+    def merge(self, other: 'TrialStats') -> None:
+        self.trials += other.trials
+        self.successes += other.successes
+        self.water_left.merge(other.water_left)
+        self.days_survived.merge(other.days_survived)
+        self.water_left_sketch.merge(other.water_left_sketch)
+        self.days_survived_sketch.merge(other.days_survived_sketch)
+
+    @property
+    def success_rate(self) -> float:
+        """
+        Survival rate in percent
+        """
+        return 100 * self.successes / self.trials
+
+    def get_percentiles(self, percentiles=BAND_PERCENTILES) -> 'tuple[np.ndarray, np.ndarray]':
+        """
+        Returns the given percentiles of (water left, days survived)
+        """
+        return (self.water_left_sketch.percentiles(percentiles), self.days_survived_sketch.percentiles(percentiles))
+
+    def to_state(self) -> list:
+        """
+        JSON serializable state, for example to store in a ResultCache, see from_state()
+        """
+        return [self.trials, self.successes,
+                [self.water_left.count, self.water_left.mean, self.water_left.m2],
+                [self.days_survived.count, self.days_survived.mean, self.days_survived.m2],
+                self.water_left_sketch.to_state(), self.days_survived_sketch.to_state()]
+
+    @classmethod
+    def from_state(cls, state) -> 'TrialStats':
+        trials, successes, water_left, days_survived, water_left_sketch, days_survived_sketch = state
+        stats = cls.__new__(cls)
+        stats.trials = trials
+        stats.successes = successes
+        stats.water_left = RunningStats(*water_left)
+        stats.days_survived = RunningStats(*days_survived)
+        stats.water_left_sketch = AdaptiveHistogramSketch.from_state(water_left_sketch)
+        stats.days_survived_sketch = HistogramSketch.from_state(days_survived_sketch)
+        return stats
+
+
+class TrajectoryBands:
+    """
+    Per-day percentiles of the metrics of many trajectories, from a histogram of every metric on
+    every day, like an AdaptiveHistogramSketch per day.
+
+    The bins of each day are 2**exponent wide and start at origin * 2**exponent, the narrowest
+    power of two that covers every value seen. When new values fall outside it, the bins are
+    widened to a larger power of two, which merges whole bins, so the counts are regridded
+    exactly. Bands of any ranges merge the same way, by regridding both to a common grid. The
+    quantiles are accurate to a bin width, about 1/bins of that day's spread of values, and
+    never lie outside the smallest and largest values seen.
+
+    Trajectories are added in blocks and not kept, so memory only depends on the number of days
+    and bins, however many trials are run.
+    """
+
+    __slots__ = ("counts", "exponents", "origins", "minimums", "maximums", "trials")
+
+    def __init__(self, metrics: int, days: int, bins: int = TRAJECTORY_BINS) -> None:
+        self.counts = np.zeros((metrics, days, bins), dtype=np.int64)
+        # (metrics, days) arrays of the bin grid and range of values of every metric on every day
+        self.exponents = np.full((metrics, days), MIN_BIN_EXPONENT, dtype=np.int64)
+        self.origins = np.zeros((metrics, days), dtype=np.int64)
+        self.minimums = np.full((metrics, days), math.inf)
+        self.maximums = np.full((metrics, days), -math.inf)
+        self.trials = 0
+
+    def get_counts(self, exponents: np.ndarray, origins: np.ndarray) -> np.ndarray:
+        """
+        Returns the counts moved to bins of the given exponents and origins, see regrid_counts()
+        """
+        # Every day has a value of every trial, so with no trials there is nothing to move
+        if self.trials == 0:
+            return self.counts
+        return regrid_counts(self.counts, self.exponents, self.origins, exponents, origins)
+
+    def add(self, data: np.ndarray) -> None:
+        """
+        Adds a (metrics, days) trajectory or a (trials, metrics, days) block of them
+        """
+        data = np.asarray(data, dtype=np.float64).reshape((-1,) + self.counts.shape[:2])
+        metrics, days, bins = self.counts.shape
+        np.minimum(self.minimums, data.min(axis=0), out=self.minimums)
+        np.maximum(self.maximums, data.max(axis=0), out=self.maximums)
+        exponents, origins = get_dyadic_grid(self.minimums, self.maximums, bins, self.exponents, self.origins,
+                                             self.exponents)
+        self.counts = self.get_counts(exponents, origins)
+        self.exponents, self.origins = exponents, origins
+
+        # Scaling by a power of two is exact, so every value lands in the bin the grid was fitted with
+        indices = np.floor(data * np.ldexp(1.0, -self.exponents)).astype(np.int64) - self.origins
+        np.clip(indices, 0, bins - 1, out=indices)
+        # Index of every value's bin in the flattened counts
+        indices += np.arange(metrics * days).reshape(metrics, days) * bins
+        self.counts += np.bincount(indices.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        self.trials += len(data)
+
+    def merge(self, other: 'TrajectoryBands') -> None:
+        if self.counts.shape != other.counts.shape:
+            raise ValueError("Only bands with the same metrics, days and bins can be merged")
+        if other.trials == 0:
+            return
+        np.minimum(self.minimums, other.minimums, out=self.minimums)
+        np.maximum(self.maximums, other.maximums, out=self.maximums)
+        exponents, origins = get_dyadic_grid(self.minimums, self.maximums, self.counts.shape[2], self.exponents,
+                                             self.origins, np.maximum(self.exponents, other.exponents))
+        self.counts = self.get_counts(exponents, origins) + other.get_counts(exponents, origins)
+        self.exponents, self.origins = exponents, origins
+        self.trials += other.trials
+
+    def get_percentiles(self, percentiles=BAND_PERCENTILES) -> np.ndarray:
+        """
+        Returns a (percentiles, metrics, days) array of the given percentiles of every metric on every
+        day, with values spread evenly within their bin
+        """
+        cumulative = np.cumsum(self.counts, axis=2)
+        bins = self.counts.shape[2]
+        values = np.full((len(percentiles),) + self.counts.shape[:2], math.nan)
+        if self.trials == 0:
+            return values
+
+        widths = np.ldexp(1.0, self.exponents)
+        for row, percentile in enumerate(percentiles):
+            # Rank of the percentile, at least just above zero so the bin found always holds values
+            targets = np.maximum(percentile / 100 * cumulative[:, :, -1:], np.nextafter(0, 1))
+            indices = np.minimum((cumulative < targets).sum(axis=2, keepdims=True), bins - 1)
+            counts = np.take_along_axis(self.counts, indices, axis=2)
+            fractions = (targets - (np.take_along_axis(cumulative, indices, axis=2) - counts)) / counts
+            values[row] = (self.origins + (indices + fractions)[:, :, 0]) * widths
+        return np.clip(values, self.minimums, self.maximums)